@@ -1,2 +1,13 @@
 # See LICENSE file for full copyright and licensing details.
-from . import models
+import logging
+import time
+
+_logger = logging.getLogger(__name__)
+_start = time.perf_counter()
+
+from . import models  # noqa: E402
+
+_logger.debug(
+    "custom_background modules imported in %.1f ms",
+    (time.perf_counter() - _start) * 1000,
+)
@@ -5,14 +5,17 @@
     "author": "BizzAppDev",
     "website": "http://www.bizzappdev.com",
     "category": "GenericModules",
-    "depends": ["base", "web"],
+    "depends": ["base", "web", "bus"],
     "summary": "Custom  Background",
     "images": ["images/image.png"],
     "init_xml": [],
     "data": [
         "security/ir.model.access.csv",
+        "security/report_background_job_security.xml",
+        "data/ir_cron.xml",
         "views/ir_actions.xml",
         "views/res_company_view.xml",
+        "views/report_background_job_view.xml",
     ],
     "installable": True,
     "application": False,
@@ -20,6 +23,9 @@
         "web.report_assets_common": [
             "/custom_background/static/src/scss/report_qweb_pdf.scss",
         ],
+        "web.assets_backend": [
+            "/custom_background/static/src/js/background_print.esm.js",
+        ],
     },
     "license": "Other proprietary",
 }
@@ -1,5 +1,8 @@
 # See LICENSE file for full copyright and licensing details.
+from . import report_background_mixin
+from . import ir_attachment
 from . import report
 from . import res_company
 from . import report_background_lang
 from . import report_company_background_lang
+from . import report_background_job
@@ -0,0 +1,12 @@
+# See LICENSE file for full copyright and licensing details.
+from odoo import fields, models
+
+
+class IrAttachment(models.Model):
+    _inherit = "ir.attachment"
+
+    custom_bg_without_background = fields.Boolean(
+        string="Stored Without Background",
+        help="The document of the report is stored without its background, which "
+        "is applied every time the document is printed.",
+    )
@@ -1,35 +1,35 @@
 # See LICENSE file for full copyright and licensing details.
 import base64
+import hashlib
+import io
+import itertools
 import logging
 import os
+import shutil
 import subprocess
 import tempfile
-from contextlib import closing
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack, closing
 
-from PyPDF2 import PdfFileReader, PdfFileWriter
-from reportlab.graphics.barcode import createBarcodeDrawing
-
-from odoo import api, fields, models
-from odoo.exceptions import UserError
-from odoo.tools import pdf
+from odoo import api, fields, models, tools
+from odoo.exceptions import AccessError, UserError
 from odoo.tools.misc import find_in_path
-from odoo.tools.safe_eval import safe_eval
 from odoo.tools.translate import _
 
-_logger = logging.getLogger(__name__)
-
+from ..tools.background_cache import background_cache
+from ..tools.background_plan import NO_BACKGROUND, BackgroundPlan, BackgroundSource
+from ..tools.background_store import background_store
+from ..tools.barcode import warm_up_barcodes
+from ..tools.pdf_engine import PyPDF2Engine, get_pdf_engine
+from ..tools.process_slots import wkhtmltopdf_slots
+from ..tools.render_cache import get_render_key, render_cache
+from ..tools.render_stats import render_stats
 
 try:
-    createBarcodeDrawing(
-        "Code128",
-        value="foo",
-        format="png",
-        width=100,
-        height=100,
-        humanReadable=1,
-    ).asString("png")
-except Exception as e:
-    _logger.info(e)
+    import resource
+except ImportError:
+    resource = None
 
 
 # --------------------------------------------------------------------------
@@ -42,8 +42,69 @@ def _get_wkhtmltopdf_bin():
     return find_in_path("wkhtmltopdf")
 
 
+def _read_memory_status(key):
+    """Return the ``key`` entry of /proc/self/status in KB, None when it cannot be
+    read."""
+    try:
+        with open("/proc/self/status") as status_file:
+            for line in status_file:
+                if line.startswith(key + ":"):
+                    return int(line.split()[1])
+    except (OSError, ValueError):
+        _logger.debug("Could not read %s of the process", key)
+    return None
+
+
+def _reset_peak_rss():
+    """Reset the peak resident set size of the process to its current resident
+    set size and return the latter in KB, None when the peak cannot be reset."""
+    try:
+        with open("/proc/self/clear_refs", "w") as clear_refs:
+            clear_refs.write("5")
+    except OSError:
+        return None
+    return _read_memory_status("VmRSS")
+
+
+def _get_peak_rss():
+    """Return the peak resident set size of the process in KB, since the last
+    ``_reset_peak_rss`` when the peak can be reset."""
+    peak_rss = _read_memory_status("VmHWM")
+    if peak_rss is not None:
+        return peak_rss
+    if not resource:
+        return 0
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def _call_wkhtmltopdf(wkhtmltopdf, max_processes=0):
+    """Run the wkhtmltopdf command, waiting for a free process slot of the host when
+    ``max_processes`` is set."""
+    with wkhtmltopdf_slots.acquire(max_processes):
+        process = subprocess.Popen(
+            wkhtmltopdf, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+        )
+        out, err = process.communicate()
+
+    if process.returncode not in [0, 1]:
+        if process.returncode == -11:
+            message = (
+                "Wkhtmltopdf failed (error code: (error code: %s). Memory limit "
+                "too low or "
+                "maximum file number of subprocess reached. Message : %s"
+            )
+        else:
+            message = "Wkhtmltopdf failed (error code: %s). Message: %s"
+        _logger.warning(message, process.returncode, err[-1000:])
+        raise UserError(message % (str(process.returncode), err[-1000:]))
+    else:
+        if err:
+            _logger.warning("wkhtmltopdf: %s" % err)
+
+
 class ReportBackgroundLine(models.Model):
     _name = "report.background.line"
+    _inherit = ["report.background.mixin"]
     _description = "Report Background Line"
 
     page_number = fields.Integer()
@@ -71,9 +132,31 @@ class ReportBackgroundLine(models.Model):
         string="Language",
     )
 
+    def _is_background_page(self, vals):
+        # Append and prepend attachments are added with all their pages.
+        return vals.get("type", self.type) not in ("append", "prepend")
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        # Compiled background plans depend on the background lines.
+        self.clear_caches()
+        return super().create(vals_list)
+
+    def write(self, vals):
+        background_cache.clear()
+        self.clear_caches()
+        return super().write(vals)
+
+    def unlink(self):
+        background_cache.clear()
+        self.clear_caches()
+        return super().unlink()
+
 
 class IrActionsReport(models.Model):
-    _inherit = "ir.actions.report"
+    _name = "ir.actions.report"
+    _inherit = ["ir.actions.report", "report.background.mixin"]
+    _background_field = "custom_report_background_image"
 
     custom_report_background = fields.Boolean()
     custom_report_background_image = fields.Binary(string="Background Image")
@@ -108,66 +191,127 @@ class IrActionsReport(models.Model):
         "report_id",
         string="Per Report Company Language Background",
     )
+    custom_bg_per_record = fields.Boolean(
+        string="Background Per Record",
+        help="When printing several records at once, resolve the language and the "
+        "company of the background for every record instead of using the first "
+        "record for the whole document. Prepend and append attachments are added "
+        "to the document of every record.",
+    )
+    custom_bg_on_download = fields.Boolean(
+        string="Store Documents Without Background",
+        help="Documents saved as attachments are stored without their background, "
+        "which is applied every time the document is printed. A changed background "
+        "then applies to the stored documents without rendering them again. The "
+        "background is applied on the document of every record on its own. "
+        "Documents stored before the option is set keep their background, the "
+        "documents stored without background still get it once the option is "
+        "unset.",
+    )
+    custom_bg_fit_page = fields.Boolean(
+        string="Fit Background To Page",
+        help="Scale the background to the size of every page of the document, so "
+        "that one background serves every paper format. By default the pages take "
+        "the size of their background.",
+    )
+    wkhtmltopdf_chunk_size = fields.Integer(
+        string="Render Chunk Size",
+        help="Number of documents rendered by each wkhtmltopdf process when the "
+        "report is rendered in parallel. The chunks are merged in order before the "
+        "background is applied. Page numbers in headers and footers restart with "
+        "every chunk. Reports saving their documents as attachments or with a "
+        "background per record are never rendered in chunks, as their document "
+        "is split per record. 0 renders all the documents with a single process.",
+    )
+    wkhtmltopdf_parallelism = fields.Integer(
+        string="Parallel Renders",
+        default=1,
+        help="Number of wkhtmltopdf processes started at once for one print when a "
+        "render chunk size is set. The total number of processes of the host is "
+        "limited by the 'custom_background.wkhtmltopdf_max_processes' system "
+        "parameter.",
+    )
+    custom_bg_async = fields.Boolean(
+        string="Print In Background",
+        help="Documents printed from the web client are rendered by a scheduled "
+        "action instead of the request. The user is notified when the document is "
+        "ready in Background Prints. Documents rendered by the code, for example "
+        "as email attachments, are still rendered at once.",
+    )
+
+    @api.model
+    def _get_company_without_custom_bg_domain(self):
+        # Companies without background per language, or without any line.
+        return ["|", ("is_bg_per_lang", "=", False), ("bg_per_lang_ids", "=", False)]
 
     def get_company_without_custom_bg(self):
         """New method for search and get company in which custom bg per language is not
         set. #22260"""
-        res_company_env = self.env["res.company"].search([])
-        # Filtered company in which is_bg_per_lang is not set and
-        # attachment is not set.
-        company = res_company_env.filtered(
-            lambda c: not c.is_bg_per_lang or not c.bg_per_lang_ids
+        return self.env["res.company"].search(
+            self._get_company_without_custom_bg_domain()
         )
-        return company
 
     @api.constrains(
         "is_bg_per_lang", "bg_per_lang_ids", "custom_report_type", "background_ids"
     )
     def _check_report_custom_bg_config(self):
         """New constrains method for check custom bg per company is set or not when for
-        'report' & 'dynamic' type. #22260"""
-        # If is_bg_per_lang is false then return.
-        if not self.is_bg_per_lang:
+        'report' & 'dynamic' type. #22260
+
+        The reports are checked together, with one query per kind of line and at
+        most one query on the companies, whatever the number of reports."""
+        # Reports without background per language are not checked.
+        reports = self.filtered("is_bg_per_lang")
+        if not reports:
             return
+        report_reports = reports.filtered(lambda r: r.custom_report_type == "report")
+        dynamic_reports = reports.filtered(lambda r: r.custom_report_type == "dynamic")
+        company_reports = reports.filtered(
+            lambda r: r.custom_report_type == "company" or not r.custom_report_type
+        )
         # If type is 'report' and custom bg per lang is not set then raise warning.
-        if self.custom_report_type == "report" and not self.bg_per_lang_ids:
+        if report_reports and len(
+            self._get_reports_with_lines("report.background.lang", report_reports)
+        ) < len(report_reports):
             raise UserError(
                 _("Please configure Custom Background Per Language for Report type!")
             )
         # If type is 'dynamic' and custom bg per lang is not set then raise warning.
-        elif self.custom_report_type == "dynamic" and not self.background_ids:
+        if dynamic_reports and len(
+            self._get_reports_with_lines("report.background.line", dynamic_reports)
+        ) < len(dynamic_reports):
             raise UserError(
                 _("Please configure Custom Background Per Language for Dynamic type!")
             )
-        # Check type is dynamic and background_ids is set or not.
-        elif self.custom_report_type == "dynamic" and self.background_ids:
-            # Filter fall_back_to_company true records.
-            fbc = self.background_ids.filtered(lambda bg: bg.fall_back_to_company)
-            # If fbc and custom bg not set at company level then raise warning.
-            if fbc:
-                company = self.get_company_without_custom_bg()
-                # If any attachment not set in the any company then raise warning.
-                if company:
-                    raise UserError(
-                        _(
-                            "Please configure Custom Background Per Language in every "
-                            "company!"
-                        )
-                    )
-        # If type is 'company' or type is not set then search
-        # configuration in all company.
-        elif self.custom_report_type == "company" or not self.custom_report_type:
-            company = self.get_company_without_custom_bg()
-            # If any attachment not set in the any company then raise warning.
-            if company:
-                raise UserError(
-                    _(
-                        "Please configure Custom Background Per Language in every "
-                        "company!"
-                    )
-                )
+        # Dynamic reports with a 'Fall Back To Company' line and the reports of
+        # type 'company' or without type need a background per language in every
+        # company.
+        fall_back_reports = dynamic_reports and self._get_reports_with_lines(
+            "report.background.line",
+            dynamic_reports,
+            [("fall_back_to_company", "=", True)],
+        )
+        if (fall_back_reports or company_reports) and self.env["res.company"].search(
+            self._get_company_without_custom_bg_domain(), limit=1
+        ):
+            raise UserError(
+                _("Please configure Custom Background Per Language in every company!")
+            )
+
+    @api.model
+    def _get_reports_with_lines(self, model_name, reports, domain=None):
+        """Return the ids of the ``reports`` having lines of ``model_name`` matching
+        ``domain``, with a single grouped query."""
+        groups = self.env[model_name].read_group(
+            [("report_id", "in", reports.ids)] + (domain or []),
+            ["report_id"],
+            ["report_id"],
+        )
+        return {group["report_id"][0] for group in groups}
 
     def _render_qweb_pdf(self, report_ref, res_ids=None, data=None):
+        # The barcode fonts are loaded on the first render of the process.
+        warm_up_barcodes()
         # Get the report. #24894
         if not self:
             report = self._get_report(report_ref)
@@ -176,51 +320,437 @@ class IrActionsReport(models.Model):
         # Get the model from the report. #24894
         Model = self.env[report.model]
         record_ids = Model.browse(res_ids)
-        company_id = False
-        if record_ids[:1]._name == "res.company":
-            company_id = record_ids[:1]
+        company_id = self._get_background_company(record_ids[:1])
+
+        # The whole print, QWeb rendering included, gives one entry of the render
+        # stats.
+        with render_stats.render(report.report_name):
+            # Add custom_bg_res_ids in context. #22260
+            # Added the parameter "report_ref". #24894
+            return super(
+                IrActionsReport,
+                self.with_context(
+                    custom_bg_res_ids=res_ids, background_company=company_id
+                ),
+            )._render_qweb_pdf(report_ref=report_ref, res_ids=res_ids, data=data)
+
+    def _get_readable_fields(self):
+        # The web client queues the prints of the reports printed in background.
+        return super()._get_readable_fields() | {
+            "custom_report_background",
+            "custom_bg_async",
+        }
+
+    def report_action(self, docids, data=None, config=True):
+        """Queue the print of the records in a background job for the reports
+        printed in background, the user is notified instead of downloading the
+        document."""
+        action = super().report_action(docids, data=data, config=config)
+        res_ids = action.get("context", {}).get("active_ids")
+        if action.get("type") != "ir.actions.report":
+            # Layout configuration wizard.
+            return action
+        if not self._should_render_async(res_ids):
+            return action
+        self.env["report.background.job"]._enqueue(self, res_ids, data)
+        return {
+            "type": "ir.actions.client",
+            "tag": "display_notification",
+            "params": {
+                "title": _("Background Print"),
+                "message": _(
+                    "The document %s is generated in the background, you will be "
+                    "notified when it is ready."
+                )
+                % self.name,
+                "type": "info",
+                "sticky": False,
+            },
+        }
+
+    def _should_render_async(self, res_ids):
+        """Return whether the print of ``res_ids`` is queued in a background job.
+        Only the PDF prints requested by the web client are queued."""
+        self.ensure_one()
+        return bool(
+            self.report_type == "qweb-pdf"
+            and self.custom_report_background
+            and self.custom_bg_async
+            and res_ids
+            and not self._context.get("custom_bg_job")
+        )
+
+    @api.model
+    def _get_background_company(self, record):
+        """Return the company whose background is used to print ``record``."""
+        if record._name == "res.company":
+            return record
         # Fix test cases error. #22107
-        elif hasattr(record_ids[:1], "company_id"):
+        elif hasattr(record, "company_id"):
             # If in record company is not set then consider current log in
             # user's company. #22476
-            company_id = record_ids[:1].company_id or self.env.user.company_id
+            return record.company_id or self.env.user.company_id
+        return self.env.company
+
+    def _render_qweb_pdf_prepare_streams(self, report_ref, data, res_ids=None):
+        """Apply the background on the document of every record when the
+        background is resolved per record, or when the documents are stored
+        without background."""
+        report = self._get_report(report_ref)
+        on_download = report._is_background_applied_on_download()
+        if not (
+            on_download
+            or (
+                report.custom_report_background
+                and report.custom_bg_per_record
+                and res_ids
+                and len(res_ids) > 1
+            )
+        ):
+            collected_streams = super()._render_qweb_pdf_prepare_streams(
+                report_ref, data, res_ids=res_ids
+            )
+            # Documents stored without background while the option was set still
+            # get their background.
+            report.with_context(**self.env.context)._apply_custom_background_on_streams(
+                collected_streams,
+                report._get_stored_res_ids_without_background(collected_streams),
+            )
+            return collected_streams
+        collected_streams = super(
+            IrActionsReport, self.with_context(custom_bg_skip_overlay=True)
+        )._render_qweb_pdf_prepare_streams(report_ref, data, res_ids=res_ids)
+        # Streams of the stored attachments already have their background, unless
+        # they were stored without it.
+        new_res_ids = [
+            res_id
+            for res_id, stream_data in collected_streams.items()
+            if stream_data["stream"] and not stream_data["attachment"]
+        ]
+        if on_download:
+            # The new documents are stored as they are rendered.
+            for res_id in new_res_ids:
+                if res_id:
+                    stream_data = collected_streams[res_id]
+                    stream_data["custom_bg_raw_stream"] = io.BytesIO(
+                        stream_data["stream"].getvalue()
+                    )
+        report.with_context(**self.env.context)._apply_custom_background_on_streams(
+            collected_streams,
+            new_res_ids
+            + report._get_stored_res_ids_without_background(collected_streams),
+        )
+        return collected_streams
+
+    def _get_stored_res_ids_without_background(self, collected_streams):
+        """Return the ids of the records whose stored document of
+        ``collected_streams`` was stored without background."""
+        self.ensure_one()
+        if not self.custom_report_background:
+            return []
+        return [
+            res_id
+            for res_id, stream_data in collected_streams.items()
+            if stream_data["stream"]
+            and stream_data["attachment"]
+            and stream_data["attachment"].sudo().custom_bg_without_background
+        ]
+
+    def _apply_custom_background_on_streams(self, collected_streams, res_ids):
+        """Apply the background on the documents of ``res_ids`` in
+        ``collected_streams``, False being the document which could not be split
+        per record."""
+        self.ensure_one()
+        if False in res_ids:
+            # The document could not be split per record, apply the background of
+            # the first record on the whole document.
+            self._apply_custom_background_on_stream(collected_streams[False])
+            res_ids = [res_id for res_id in res_ids if res_id is not False]
+        if not res_ids:
+            return
+        if self.custom_bg_per_record:
+            self._apply_custom_background_per_record(collected_streams, res_ids)
         else:
-            company_id = self.env.company
-
-        # Add custom_bg_res_ids in context. #22260
-        # Added the parameter "report_ref". #24894
-        return super(
-            IrActionsReport,
-            self.with_context(custom_bg_res_ids=res_ids, background_company=company_id),
-        )._render_qweb_pdf(report_ref=report_ref, res_ids=res_ids, data=data)
-
-    def add_pdf_watermarks(self, custom_background_data, page):
-        """create a temp file and set datas and added in report page. #T4209"""
-        temp_back_id, temp_back_path = tempfile.mkstemp(
-            suffix=".pdf", prefix="back_report.tmp."
+            for res_id in res_ids:
+                self._apply_custom_background_on_stream(collected_streams[res_id])
+
+    def _is_background_applied_on_download(self):
+        """Return whether the documents stored as attachments are kept without
+        background, the background being applied when they are printed."""
+        self.ensure_one()
+        return bool(
+            self.custom_report_background
+            and self.custom_bg_on_download
+            and self.attachment
         )
-        back_data = base64.b64decode(custom_background_data)
-        with closing(os.fdopen(temp_back_id, "wb")) as back_file:
-            back_file.write(back_data)
-        pdf_reader_watermark = PdfFileReader(temp_back_path, "rb")
-        watermark_page = pdf_reader_watermark.getPage(0)
-        watermark_page.mergePage(page)
-        return watermark_page
+
+    def _prepare_pdf_report_attachment_vals_list(self, report, streams):
+        """Store the documents without background when the background is applied
+        when they are printed."""
+        raw_res_ids = {
+            res_id
+            for res_id, stream_data in streams.items()
+            if "custom_bg_raw_stream" in stream_data
+        }
+        streams = {
+            res_id: dict(stream_data, stream=stream_data["custom_bg_raw_stream"])
+            if res_id in raw_res_ids
+            else stream_data
+            for res_id, stream_data in streams.items()
+        }
+        vals_list = super()._prepare_pdf_report_attachment_vals_list(report, streams)
+        # Only the documents stored without background get it when printed.
+        for vals in vals_list:
+            if vals.get("res_id") in raw_res_ids:
+                vals["custom_bg_without_background"] = True
+        return vals_list
+
+    def _apply_custom_background_on_stream(self, stream_data, resolver=None):
+        stream = stream_data["stream"]
+        output_stream = io.BytesIO()
+        if self._apply_custom_background(stream, output_stream, resolver=resolver):
+            stream_data["stream"] = output_stream
+            stream.close()
+
+    def _apply_custom_background_per_record(self, collected_streams, res_ids):
+        """Apply the background of every record on its own document. Records are
+        grouped by company and language so the background of every group is only
+        resolved once."""
+        self.ensure_one()
+        groups = defaultdict(list)
+        for record in self.env[self.model].browse(res_ids):
+            key = (self._get_background_company(record), self._get_record_lang(record))
+            groups[key].append(record.id)
+        for (company, lang_code), group_res_ids in groups.items():
+            report = self.with_context(
+                custom_bg_res_ids=group_res_ids,
+                custom_bg_lang=lang_code,
+                background_company=company,
+            )
+            with render_stats.stage("orm"):
+                resolver = report._get_custom_background_resolver()
+            for res_id in group_res_ids:
+                report._apply_custom_background_on_stream(
+                    collected_streams[res_id], resolver=resolver
+                )
+
+    @api.model
+    def _get_background_attachment(self, record, field_name="background_pdf"):
+        """Return the attachment storing the background binary ``field_name`` of
+        ``record``, an empty recordset if no background is set."""
+        attachment_env = self.env["ir.attachment"].sudo()
+        if not record:
+            return attachment_env
+        return attachment_env.search(
+            [
+                ("res_model", "=", record._name),
+                ("res_field", "=", field_name),
+                ("res_id", "=", record.id),
+            ],
+            limit=1,
+        )
+
+    @api.model
+    def _get_background_source(self, record, field_name="background_pdf"):
+        """Return the ``BackgroundSource`` of the background binary ``field_name``
+        of ``record``, ``NO_BACKGROUND`` if no background is set."""
+        attachment = self._get_background_attachment(record, field_name)
+        if not attachment:
+            return NO_BACKGROUND
+        return BackgroundSource(attachment.id, attachment.checksum)
+
+    @api.model
+    def _get_background_data(self, source):
+        """Return the raw PDF data of the background ``source``, read from the
+        filestore or the database without going through base64."""
+        return self.env["ir.attachment"].sudo().browse(source.attachment_id).raw
+
+    @api.model
+    def _get_background_path(self, source):
+        """Return the path of the filestore file of the background ``source``,
+        False when it is stored in the database or its file is missing."""
+        attachment = self.env["ir.attachment"].sudo().browse(source.attachment_id)
+        if not attachment.store_fname:
+            return False
+        path = attachment._full_path(attachment.store_fname)
+        return os.path.isfile(path) and path
+
+    @api.model
+    def _open_background_document(self, engine, source):
+        """Open the whole PDF of the attachment ``source`` with the PDF
+        ``engine``, mapping its filestore file when possible."""
+        path = self._get_background_path(source)
+        if path:
+            return engine.open_file(path)
+        return engine.open(io.BytesIO(self._get_background_data(source)))
+
+    @api.model
+    def _get_pdf_engine(self):
+        """Return the PDF engine applying the backgrounds, the fastest installed
+        one unless the 'custom_background.pdf_engine' system parameter forces one
+        (pikepdf, pypdf or PyPDF2)."""
+        return get_pdf_engine(
+            self.env["ir.config_parameter"]
+            .sudo()
+            .get_param("custom_background.pdf_engine", "auto")
+        )
+
+    @api.model
+    def _get_background_page(self, background, engine=None):
+        """Return the background parsed by the PDF ``engine`` (PyPDF2 by default),
+        from the background cache when possible.
+
+        :param background: ``BackgroundSource``, ``ir.attachment`` record of the
+            background or its base64 data, the cache key is the attachment checksum
+            in every case.
+        """
+        engine = engine or PyPDF2Engine()
+        if isinstance(background, models.BaseModel):
+            background = BackgroundSource(background.id, background.checksum)
+        if isinstance(background, BackgroundSource):
+            checksum, get_data = (
+                background.checksum,
+                lambda: self._get_background_data(background),
+            )
+        else:
+            back_data = base64.b64decode(background)
+            checksum, get_data = hashlib.sha1(back_data).hexdigest(), lambda: back_data
+
+        def parse_background():
+            render_stats.count("background_misses")
+            with render_stats.stage("decode"):
+                # The files of the filestore are mapped as they are, they are
+                # already shared by the workers.
+                path = isinstance(
+                    background, BackgroundSource
+                ) and self._get_background_path(background)
+                if path:
+                    return engine.parse_background_file(path)
+                # Parse the file of the background store, written by the first
+                # worker of the host needing the background.
+                directory = self._get_background_store_directory()
+                path = directory and background_store.get(directory, checksum)
+                if path:
+                    return engine.parse_background_file(path)
+                data = get_data()
+                render_stats.count("background_bytes", len(data))
+                path = directory and background_store.put(directory, checksum, data)
+                if path:
+                    return engine.parse_background_file(path)
+                return engine.parse_background(data)
+
+        render_stats.count("background_lookups")
+        return background_cache.get((engine.name, checksum), parse_background)
+
+    @api.model
+    def _check_stats_access(self):
+        """The render and cache stats show the reports printed by every user of
+        the worker, only the administrators may read them."""
+        if not self.env.is_admin():
+            raise AccessError(_("Only administrators can read the render stats."))
+
+    @api.model
+    def get_background_cache_stats(self):
+        """Return the size and the hit/miss counters of the background cache of
+        the current process, with the ones of the background store."""
+        self._check_stats_access()
+        directory = self._get_background_store_directory()
+        return dict(
+            background_cache.stats(),
+            store=background_store.stats(directory or None),
+        )
+
+    @api.model
+    def _get_background_store_directory(self):
+        """Return the directory of the background store of the database, set by
+        the 'custom_background.background_store_directory' system parameter. The
+        store is in shared memory by default, it is disabled when the parameter is
+        False. It only holds the backgrounds stored in the database, the files of
+        the filestore are mapped as they are."""
+        directory = (
+            self.env["ir.config_parameter"]
+            .sudo()
+            .get_param("custom_background.background_store_directory", "")
+        )
+        if directory and not tools.str2bool(directory, True):
+            return False
+        if not directory:
+            # One store per Unix user, the store of another user is not used.
+            directory = (
+                "/dev/shm/custom_background-%d" % os.getuid()
+                if os.path.isdir("/dev/shm")
+                else os.path.join(
+                    tools.config["data_dir"], "custom_background_backgrounds"
+                )
+            )
+        return os.path.join(directory, self.env.cr.dbname)
+
+    @api.model
+    def _clean_background_store(self, checksums=None):
+        """Remove the backgrounds of ``checksums`` (every stored background by
+        default) from the background store when no attachment uses them anymore."""
+        directory = self._get_background_store_directory()
+        if not directory:
+            return
+        if checksums is None:
+            checksums = background_store.checksums(directory)
+        checksums = {checksum for checksum in checksums if checksum}
+        if not checksums:
+            return
+        self.env["ir.attachment"].flush_model(["checksum"])
+        self.env.cr.execute(
+            "SELECT checksum FROM ir_attachment WHERE checksum IN %s",
+            [tuple(checksums)],
+        )
+        used_checksums = {row[0] for row in self.env.cr.fetchall()}
+        background_store.remove(directory, checksums - used_checksums)
+
+    @api.autovacuum
+    def _gc_background_store(self):
+        """Remove the stored backgrounds of the attachments changed or removed
+        outside of the background configuration."""
+        self._clean_background_store()
+
+    @api.model
+    def get_render_stats(self):
+        """Return the stage timings of the last renders of the current process,
+        with their averages per report, the slowest reports first."""
+        self._check_stats_access()
+        return {
+            "reports": render_stats.summary(),
+            "renders": render_stats.renders(),
+        }
+
+    def add_pdf_watermarks(self, custom_background_data, page, fit=False):
+        """Merge the report page on the background, scaled to the size of the page
+        when ``fit`` is set. The parsed background is shared through the background
+        cache. #T4209"""
+        engine = PyPDF2Engine()
+        watermark_page = self._get_background_page(custom_background_data, engine)
+        return engine.overlay_page(watermark_page, page, fit=fit)
 
     def get_lang(self):
         """New method for return language, if partner_id is available in model and
         partner is set in that model, else set current logged in user's language.
         #22260"""
+        # Language already resolved for the records being printed.
+        if self._context.get("custom_bg_lang"):
+            return self._context["custom_bg_lang"]
         res_record_ids = self._context.get("custom_bg_res_ids")
         model = self.env[self.model]
         record_ids = model.browse(res_record_ids)
+        # NOTE: Used "record_ids[:1]" to avoid loop, if use loop then always set last
+        # record partner's language.
+        return self._get_record_lang(record_ids[:1])
+
+    def _get_record_lang(self, record):
+        """Return the language of the partner of ``record`` or the current user's
+        language. #22260"""
         lang_code = False
         # If partner_id field in the model and partner is set in the model the consider
         # partner's language.
-        # NOTE: Used "record_ids[:1]" to avoid loop, if use loop then always set last
-        # record partner's language.
-        if "partner_id" in model._fields and record_ids[:1].partner_id:
-            partner_lang = record_ids[:1].partner_id.lang
+        if "partner_id" in record._fields and record.partner_id:
+            partner_lang = record.partner_id.lang
             lang_code = partner_lang if partner_lang else "en_US"
         else:
             # If partner_id field is not in model or partner_id is not set then consider
@@ -261,58 +791,492 @@ class IrActionsReport(models.Model):
             custom_background = self._get_background_per_report_company_language()
             return custom_background
 
+        # Set 1st custom background.
+        custom_background = self._get_bg_per_lang_line().background_pdf
+        return custom_background
+
+    def _get_bg_per_lang_line(self):
+        """Return the first background per language line of the report or of the
+        company (for report type and company type) matching the partner language."""
+        lang_code = self.get_lang()
         # If custom_report_type is report then set report(self) id.
         if self.custom_report_type == "report":
             custom_bg_from = self
         # If custom_report_type is company then set current company id from context.
-        if self.custom_report_type == "company" or not self.custom_report_type:
-            custom_bg_from = company_background
-
+        else:
+            custom_bg_from = self._context.get("background_company")
         # Filter records from report_background_lang model based on the languages.
         # custom_bg_from: company_id or report_id(self).
         custom_bg_lang = custom_bg_from.bg_per_lang_ids.filtered(
             lambda lang: lang.lang_id.code == lang_code
         )
+        return custom_bg_lang[:1]
 
-        # Set 1st custom background.
-        custom_background = custom_bg_lang[:1].background_pdf
-        return custom_background
+    def _get_background_plan(self):
+        """Return the compiled background plan of the dynamic report for the
+        language and the company of the records being printed."""
+        self.ensure_one()
+        company = self._context.get("background_company")
+        return self._compile_background_plan(
+            self.get_lang(), company.id if company else False
+        )
+
+    @tools.ormcache("self.id", "lang_code", "company_id")
+    def _compile_background_plan(self, lang_code, company_id):
+        """Compile the background lines of the dynamic report into a
+        ``BackgroundPlan``. The plan is cached in the registry and invalidated when
+        the background configuration changes."""
+        report = self.sudo()
+        company = self.env["res.company"].sudo().browse(company_id)
+        if report.is_bg_per_lang:
+            lines = report.background_ids.filtered(
+                lambda line: line.lang_id.code == lang_code
+            )
+        else:
+            lines = report.background_ids.filtered(lambda line: not line.lang_id)
+        lines = lines.sorted("id")
+
+        # Background of the company, used by the 'Fall Back To Company' lines.
+        # #22260
+        if report.is_bg_per_lang:
+            company_source = self._get_background_source(
+                company.bg_per_lang_ids.filtered(
+                    lambda lang: lang.lang_id.code == lang_code
+                )[:1]
+            )
+        else:
+            company_source = self._get_background_source(
+                company, "custom_report_background_image"
+            )
+
+        def line_source(line):
+            if line.fall_back_to_company and company:
+                return company_source
+            return self._get_background_source(line)
+
+        def first_line(line_type):
+            return lines.filtered(lambda line: line.type == line_type)[:1]
+
+        first_page = first_line("first_page")
+        last_page = first_line("last_page")
+        remaining = first_line("remaining")
+        expression = first_line("expression")
+        fixed_pages = {}
+        for line in lines.filtered(lambda line: line.type == "fixed"):
+            if line.page_number not in fixed_pages:
+                fixed_pages[line.page_number] = line_source(line)
+        expression_source = None
+        if expression.page_expression:
+            expression_source = line_source(expression)
+            # An expression without any background falls back to the remaining
+            # pages rule.
+            if not expression_source.attachment_id and not (
+                expression.fall_back_to_company and company
+            ):
+                expression_source = None
+        return BackgroundPlan(
+            first_page=line_source(first_page) if first_page else None,
+            last_page=line_source(last_page) if last_page else None,
+            fixed_pages=fixed_pages,
+            expression=expression.page_expression or None,
+            expression_source=expression_source,
+            remaining=line_source(remaining) if remaining else None,
+            append=[
+                self._get_background_source(line)
+                for line in lines.filtered(lambda line: line.type == "append")
+            ],
+            prepend=[
+                self._get_background_source(line)
+                for line in lines.filtered(lambda line: line.type == "prepend")
+            ],
+        )
+
+    @tools.ormcache("self.id")
+    def _get_company_lang_background_map(self):
+        """Return the lines of the background configuration per report, company
+        and language by type and by (company id, language code), False for a line
+        without company or language. Every value is a tuple of (line id,
+        ``BackgroundSource``) ordered by line id.
+
+        The map is cached in the registry and invalidated when the lines change.
+        #T5886
+        """
+        lines = (
+            self.env["report.company.background.lang"]
+            .sudo()
+            .search([("report_id", "=", self.id)], order="id")
+        )
+        attachments = (
+            self.env["ir.attachment"]
+            .sudo()
+            .search(
+                [
+                    ("res_model", "=", lines._name),
+                    ("res_field", "=", "background_pdf"),
+                    ("res_id", "in", lines.ids),
+                ]
+            )
+        )
+        sources = {
+            attachment.res_id: BackgroundSource(attachment.id, attachment.checksum)
+            for attachment in attachments
+        }
+        background_map = defaultdict(lambda: defaultdict(list))
+        for line in lines:
+            key = (line.company_id.id, line.lang_id.code or False)
+            background_map[line.type_attachment][key].append(
+                (line.id, sources.get(line.id, NO_BACKGROUND))
+            )
+        return {
+            type_attachment: {
+                key: tuple(entries) for key, entries in entries_map.items()
+            }
+            for type_attachment, entries_map in background_map.items()
+        }
+
+    def _resolve_company_lang_lines(
+        self, type_attachment, company_id, lang_code, fallback=True
+    ):
+        """Return the (line id, ``BackgroundSource``) of the lines of
+        ``type_attachment`` of the first configuration matching, in this order, the
+        company and the language, the company only, the language only or neither
+        of them. Only the company and the language are matched without
+        ``fallback``. #T5886"""
+        lines = self._get_company_lang_background_map().get(type_attachment, {})
+        if not fallback:
+            return lines.get((company_id, lang_code), ())
+        for key in (
+            (company_id, lang_code),
+            (company_id, False),
+            (False, lang_code),
+            (False, False),
+        ):
+            if key in lines:
+                return lines[key]
+        return ()
 
     def _get_background_per_report_company_language(self):
         """New method for get the custom background based on the report configuration
         based on the per company and per Lang. #T5886"""
         self.ensure_one()
-        lang_code = self.get_lang()
         company = self._context.get("background_company")
+        lines = self._resolve_company_lang_lines(
+            "background", company.id if company else False, self.get_lang()
+        )
+        if not lines:
+            return False
+        return (
+            self.env["report.company.background.lang"]
+            .browse(lines[0][0])
+            .background_pdf
+        )
 
-        # Get the custom background if company and Lang are both matched. #T5886
-        custom_background = self.per_report_com_lang_bg_ids.filtered(
-            lambda bg: bg.lang_id.code == lang_code and bg.company_id.id == company.id
+    def _get_custom_background_sources(self, num_pages):
+        """Return the background source of every page of a document of
+        ``num_pages`` pages, with the prepend and append sources of the report.
+        The language and the company of the background are taken from the
+        context."""
+        (
+            get_page_sources,
+            prepend_sources,
+            append_sources,
+        ) = self._get_custom_background_resolver()
+        page_sources = (
+            get_page_sources(num_pages) if get_page_sources else [None] * num_pages
         )
-        if custom_background:
-            return custom_background[:1].background_pdf
+        return page_sources, prepend_sources, append_sources
+
+    def _get_custom_background_resolver(self):
+        """Resolve the backgrounds of the report without the document, for the
+        language and the company of the context.
+
+        :return: a function returning the background source of every page of a
+            document from its number of pages, None when no page can get a
+            background, with the prepend and append sources of the report.
+        """
+        self.ensure_one()
+        report = self
+        prepend_sources = append_sources = ()
+        # Dynamic Type and Background Per Report - Company - Lang #T5886
+        if report.custom_report_type == "dynamic":
+            # Resolve the background of every page from the compiled background
+            # plan of the report instead of searching the background lines on
+            # every render.
+            plan = report._get_background_plan()
+            get_page_sources = (
+                plan.get_page_sources if plan.has_page_backgrounds() else None
+            )
+            append_sources, prepend_sources = plan.append, plan.prepend
+        elif report.custom_report_type == "dynamic_per_report_company_lang":
+            # Resolve the background once for the whole document, following the
+            # company and language fallbacks of the configuration. #T6622
+            company = self._context.get("background_company")
+            company_id = company.id if company else False
+            lang_code = report.get_lang()
+            background_lines = report._resolve_company_lang_lines(
+                "background", company_id, lang_code
+            )
+            background = background_lines[0][1] if background_lines else None
+            get_page_sources = (
+                (lambda num_pages: [background] * num_pages)
+                if background and background.attachment_id
+                else None
+            )
+            # The append and prepend attachments of the company and the language.
+            # #T6622
+            append_sources = [
+                source
+                for _line_id, source in report._resolve_company_lang_lines(
+                    "append", company_id, lang_code, fallback=False
+                )
+            ]
+            prepend_sources = [
+                source
+                for _line_id, source in report._resolve_company_lang_lines(
+                    "prepend", company_id, lang_code, fallback=False
+                )
+            ]
+        else:
+            custom_background = False
+            # From Report Type.
+            if report.custom_report_type == "report":
+                # 222760 Starts.If background per lang is True then call method for
+                # get custom background based on different languages.
+                if report.is_bg_per_lang:
+                    custom_background = report._get_background_attachment(
+                        report._get_bg_per_lang_line()
+                    )
+                # 222760 Ends.
+                else:
+                    custom_background = report._get_background_attachment(
+                        report, "custom_report_background_image"
+                    )
+                # 222760 Ends.
+            # From Company Type.
+            if (
+                not custom_background
+                and (
+                    report.custom_report_type == "company"
+                    or not report.custom_report_type
+                )
+                and self._context.get("background_company")  # #19896
+            ):
+                # report background will be displayed based on the current
+                # company #19896
+                company_id = self._context.get("background_company")
+                # 222760 Starts. If background per lang is True then call method for
+                # get custom background from company based on different languages.
+                if report.is_bg_per_lang:
+                    custom_background = report._get_background_attachment(
+                        report._get_bg_per_lang_line()
+                    )
+                # 222760 Ends.
+                else:
+                    custom_background = report._get_background_attachment(
+                        company_id, "custom_report_background_image"
+                    )
+            # If background found from any type then set that to the report.
+            get_page_sources = (
+                (lambda num_pages: [custom_background] * num_pages)
+                if custom_background
+                else None
+            )
+        return get_page_sources, prepend_sources, append_sources
 
-        # Get the custom background if company matched but Lang is not set. #T5886
-        custom_bg_only_with_company = self.per_report_com_lang_bg_ids.filtered(
-            lambda bg: bg.company_id.id == company.id and not bg.lang_id.code
+    def _get_background_fingerprint(self):
+        """Return a tuple identifying the backgrounds of the report for the
+        language and the company of the context, whatever the number of pages of
+        the document."""
+        self.ensure_one()
+        if self.custom_report_type == "dynamic":
+            return (
+                "dynamic",
+                self.custom_bg_fit_page,
+            ) + self._get_background_plan().fingerprint()
+        # The other types give the same background to every page.
+        (
+            page_sources,
+            prepend_sources,
+            append_sources,
+        ) = self._get_custom_background_sources(1)
+        return (
+            self.custom_report_type,
+            self.custom_bg_fit_page,
+            tuple(source.checksum if source else False for source in page_sources),
+            tuple(source.checksum for source in prepend_sources),
+            tuple(source.checksum for source in append_sources),
         )
-        if custom_bg_only_with_company:
-            return custom_bg_only_with_company[:1].background_pdf
 
-        # Get the custom background if Lang matched but company is not set. #T5886
-        custom_bg_only_with_lang = self.per_report_com_lang_bg_ids.filtered(
-            lambda bg: bg.lang_id.code == lang_code and not bg.company_id
+    def _apply_custom_background(self, pdf_stream, output_stream, resolver=None):
+        """Apply the custom background of the report on the PDF read from
+        ``pdf_stream`` and write the result into ``output_stream``.
+
+        The backgrounds are resolved before the document is read, a document
+        without any background nor prepend and append attachments is left as it
+        is. Content pages are read lazily and the prepend and append attachments
+        are added to the same output, so the document is only written once.
+
+        :param resolver: result of ``_get_custom_background_resolver``, resolved
+            for the context when not given.
+        :return: False if the document is left as it is, nothing is written in
+            ``output_stream`` in that case.
+        """
+        self.ensure_one()
+        report = self
+        engine = report._get_pdf_engine()
+        try:
+            if resolver is None:
+                with render_stats.stage("orm"):
+                    resolver = report._get_custom_background_resolver()
+            get_page_sources, prepend_sources, append_sources = resolver
+            if not (get_page_sources or prepend_sources or append_sources):
+                return False
+            document = engine.open(pdf_stream)
+            num_pages = engine.page_count(document)
+            page_sources = (
+                get_page_sources(num_pages) if get_page_sources else [None] * num_pages
+            )
+            if not (any(page_sources) or prepend_sources or append_sources):
+                # No page of this document falls in the configured rules.
+                return False
+
+            render_stats.count("pages", num_pages)
+            # Every background is parsed once, before the pages are merged.
+            backgrounds = {
+                source: report._get_background_page(source, engine)
+                for source in set(page_sources)
+                if source
+            }
+            output = engine.new_output()
+            with render_stats.stage("append_prepend"):
+                # Merge multiple prepend attachment. #T6622
+                report._add_attachment_pages(engine, output, prepend_sources)
+            with render_stats.stage("merge"):
+                if backgrounds:
+                    for i in range(num_pages):
+                        engine.add_page(
+                            output,
+                            document,
+                            i,
+                            backgrounds.get(page_sources[i]),
+                            fit=report.custom_bg_fit_page,
+                        )
+                else:
+                    engine.add_document(output, document)
+            with render_stats.stage("append_prepend"):
+                # Merge multiple append attachment. #T6622
+                report._add_attachment_pages(engine, output, append_sources)
+            with render_stats.stage("merge"):
+                engine.save(output, output_stream)
+        except Exception as ex:
+            logging.info("Error while PDF Background %s" % ex)
+            raise
+        return True
+
+    @api.model
+    def _add_attachment_pages(self, engine, output, sources):
+        """Add all the pages of the prepend or append attachments ``sources`` to the
+        ``output`` of the PDF ``engine``."""
+        sources = [source for source in sources if source.attachment_id]
+        if sources:
+            bundle = self._get_attachment_bundle(engine, sources)
+            engine.add_document(output, engine.open(io.BytesIO(bundle)))
+
+    @api.model
+    def _get_attachment_bundle(self, engine, sources):
+        """Return the PDF of the attachments ``sources`` one after the other.
+
+        The bundle is built once and kept in the background cache, keyed by the
+        checksums of the attachments, so a changed line never hits a stale bundle.
+        Renders only open the bundle, whose pages are read lazily, as the parsed
+        documents are altered when their pages are written in an output.
+        """
+
+        def build_bundle():
+            render_stats.count("bundle_misses")
+            if len(sources) == 1:
+                return self._get_background_data(sources[0])
+            bundle = engine.new_output()
+            for source in sources:
+                engine.add_document(
+                    bundle, self._open_background_document(engine, source)
+                )
+            bundle_stream = io.BytesIO()
+            engine.save(bundle, bundle_stream)
+            return bundle_stream.getvalue()
+
+        render_stats.count("bundle_lookups")
+        return background_cache.get(
+            ("bundle",) + tuple(source.checksum for source in sources), build_bundle
         )
-        if custom_bg_only_with_lang:
-            return custom_bg_only_with_lang[:1].background_pdf
 
-        # Get the custom background if Lang is not set and company is not set. #T5886
-        default_custom_bg = self.per_report_com_lang_bg_ids.filtered(
-            lambda bg: not bg.lang_id and not bg.company_id
+    @api.model
+    def _get_wkhtmltopdf_max_processes(self):
+        """Return the maximum number of wkhtmltopdf processes started at once by
+        the chunked renders of all the workers of the host."""
+        return int(
+            self.env["ir.config_parameter"]
+            .sudo()
+            .get_param(
+                "custom_background.wkhtmltopdf_max_processes", os.cpu_count() or 1
+            )
         )
-        if default_custom_bg:
-            return default_custom_bg[:1].background_pdf
-        return False
+
+    @api.model
+    def _get_render_cache_size(self):
+        """Return the maximum size in bytes of the cache of rendered documents,
+        set in MB by the 'custom_background.render_cache_size' system parameter.
+        The cache is disabled by default."""
+        return (
+            int(
+                self.env["ir.config_parameter"]
+                .sudo()
+                .get_param("custom_background.render_cache_size", 0)
+            )
+            * 1024
+            * 1024
+        )
+
+    @api.model
+    def _get_render_cache_directory(self):
+        return os.path.join(
+            tools.config["data_dir"],
+            "custom_background_renders",
+            self.env.cr.dbname,
+        )
+
+    @api.model
+    def get_render_cache_stats(self):
+        """Return the hit/miss counters of the render cache of the current process
+        and the number and size of the cached documents."""
+        self._check_stats_access()
+        return render_cache.stats(self._get_render_cache_directory())
+
+    @api.model
+    def _is_overlay_in_memory(self):
+        """Return whether the documents of the background overlay are kept in
+        memory instead of temporary files."""
+        return tools.str2bool(
+            self.env["ir.config_parameter"]
+            .sudo()
+            .get_param("custom_background.overlay_in_memory", "False")
+        )
+
+    @api.model
+    def _get_render_private_directory(self):
+        """Return the directory in which every render creates a private directory
+        for its temporary files, removed at once at the end of the render, when
+        the 'custom_background.render_private_directory' system parameter is set.
+        The directory is in shared memory when available, None for the default
+        temporary directory. Return False when the temporary files are created
+        and removed one by one."""
+        if not tools.str2bool(
+            self.env["ir.config_parameter"]
+            .sudo()
+            .get_param("custom_background.render_private_directory", "False")
+        ):
+            return False
+        return "/dev/shm" if os.path.isdir("/dev/shm") else None
 
     @api.model
     def _run_wkhtmltopdf(  # noqa: C901
@@ -349,403 +1313,246 @@ class IrActionsReport(models.Model):
             else self.get_paperformat()
         )
         report = self._get_report(report_ref)
-        # Build the base command args for wkhtmltopdf bin
-        command_args = self._build_wkhtmltopdf_args(
-            paperformat_id,
-            landscape,
-            specific_paperformat_args=specific_paperformat_args,
-            set_viewport_size=set_viewport_size,
-        )
-
-        files_command_args = []
-        temporary_files = []
-        if header:
-            head_file_fd, head_file_path = tempfile.mkstemp(
-                suffix=".html", prefix="report.header.tmp."
-            )
-            with closing(os.fdopen(head_file_fd, "wb")) as head_file:
-                head_file.write(header.encode())
-            temporary_files.append(head_file_path)
-            files_command_args.extend(["--header-html", head_file_path])
-        if footer:
-            foot_file_fd, foot_file_path = tempfile.mkstemp(
-                suffix=".html", prefix="report.footer.tmp."
-            )
-            with closing(os.fdopen(foot_file_fd, "wb")) as foot_file:
-                foot_file.write(footer.encode())
-            temporary_files.append(foot_file_path)
-            files_command_args.extend(["--footer-html", foot_file_path])
-
-        paths = []
-        for i, body in enumerate(bodies):
-            prefix = "%s%d." % ("report.body.tmp.", i)
-            body_file_fd, body_file_path = tempfile.mkstemp(
-                suffix=".html", prefix=prefix
+        # Every render gives one log line with its stage timings and counters.
+        with render_stats.render(report.report_name if report else "report"):
+            render_stats.count("documents", len(bodies))
+            # The peak memory is measured per render when the kernel can reset it,
+            # the renders of other threads of the process still count.
+            start_rss = _reset_peak_rss()
+            peak_rss = _get_peak_rss()
+            # Build the base command args for wkhtmltopdf bin
+            command_args = self._build_wkhtmltopdf_args(
+                paperformat_id,
+                landscape,
+                specific_paperformat_args=specific_paperformat_args,
+                set_viewport_size=set_viewport_size,
             )
-            with closing(os.fdopen(body_file_fd, "wb")) as body_file:
-                body_file.write(body.encode())
-            paths.append(body_file_path)
-            temporary_files.append(body_file_path)
-
-        pdf_report_fd, pdf_report_path = tempfile.mkstemp(
-            suffix=".pdf", prefix="report.tmp."
-        )
-        os.close(pdf_report_fd)
-        temporary_files.append(pdf_report_path)
-        try:
-            wkhtmltopdf = (
-                [_get_wkhtmltopdf_bin()]
-                + command_args
-                + files_command_args
-                + paths
-                + [pdf_report_path]
-            )
-            process = subprocess.Popen(
-                wkhtmltopdf, stdout=subprocess.PIPE, stderr=subprocess.PIPE
-            )
-            out, err = process.communicate()
-
-            if process.returncode not in [0, 1]:
-                if process.returncode == -11:
-                    message = (
-                        "Wkhtmltopdf failed (error code: (error code: %s). Memory limit "
-                        "too low or "
-                        "maximum file number of subprocess reached. Message : %s"
-                    )
-                else:
-                    message = "Wkhtmltopdf failed (error code: %s). Message: %s"
-                _logger.warning(message, process.returncode, err[-1000:])
-                raise UserError(message % (str(process.returncode), err[-1000:]))
-            else:
-                if err:
-                    _logger.warning("wkhtmltopdf: %s" % err)
-            # Dynamic Type and Background Per Report - Company - Lang #T5886
 
+            # Documents with the same HTML, paper format and backgrounds are served from
+            # the render cache, without running wkhtmltopdf nor applying the
+            # background.
+            render_key = None
+            render_cache_size = self._get_render_cache_size()
             if (
-                report
+                render_cache_size
+                and report
                 and report.custom_report_background
-                and report.custom_report_type
-                in ["dynamic", "dynamic_per_report_company_lang"]
+                and not self._context.get("custom_bg_skip_overlay")
             ):
-                temp_report_id, temp_report_path = tempfile.mkstemp(
-                    suffix=".pdf", prefix="with_back_report.tmp."
+                render_key = get_render_key(
+                    report.id,
+                    command_args,
+                    header or "",
+                    footer or "",
+                    report.with_context(
+                        **self.env.context
+                    )._get_background_fingerprint(),
+                    *bodies
                 )
-                output = PdfFileWriter()
-                pdf_reader_content = PdfFileReader(pdf_report_path, "rb")
-
-                # Call method for get domain related to the languages. #22260
-                lang_domain = report.with_context(**self.env.context).get_bg_per_lang()
-
-                first_page = (
-                    last_page
-                ) = fixed_page = remaining_pages = expression = False
-                if report.custom_report_type == "dynamic":
-                    # Added lang_domain in all search methods. #22260
-                    first_page = report.background_ids.search(
-                        lang_domain
-                        + [
-                            ("type", "=", "first_page"),
-                            ("report_id", "=", report.id),
-                        ],
-                        limit=1,
+                with render_stats.stage("render_cache"):
+                    pdf_content = render_cache.get(
+                        self._get_render_cache_directory(), render_key
                     )
-                    last_page = report.background_ids.search(
-                        lang_domain
-                        + [
-                            ("type", "=", "last_page"),
-                            ("report_id", "=", report.id),
-                        ],
-                        limit=1,
+                if pdf_content is not None:
+                    render_stats.count("render_cache_hits")
+                    render_stats.count("output_bytes", len(pdf_content))
+                    return pdf_content
+                render_stats.count("render_cache_misses")
+
+            files_command_args = []
+            temporary_files = []
+            # The temporary files are created in a private directory of the render,
+            # removed at once, or one by one in the temporary directory. Every
+            # temporary file is registered before it is written and removed at the
+            # end, even when the rendering fails.
+            render_directory = None
+            file_numbers = itertools.count()
+
+            def new_temporary_file(suffix, prefix):
+                if render_directory:
+                    # Nobody else writes in the directory, the names are unique.
+                    path = os.path.join(
+                        render_directory,
+                        "%s%d%s" % (prefix, next(file_numbers), suffix),
                     )
-                    fixed_pages = report.background_ids.search(
-                        lang_domain
-                        + [
-                            ("type", "=", "fixed"),
-                            ("report_id", "=", report.id),
-                        ]
+                    return (
+                        os.open(path, os.O_RDWR | os.O_CREAT | os.O_EXCL, 0o600),
+                        path,
                     )
-                    remaining_pages = report.background_ids.search(
-                        lang_domain
-                        + [
-                            ("type", "=", "remaining"),
-                            ("report_id", "=", report.id),
-                        ],
-                        limit=1,
+                file_fd, path = tempfile.mkstemp(suffix=suffix, prefix=prefix)
+                temporary_files.append(path)
+                return file_fd, path
+
+            try:
+                private_directory = self._get_render_private_directory()
+                if private_directory is not False:
+                    render_directory = tempfile.mkdtemp(
+                        prefix="report.", dir=private_directory
                     )
-                    expression = report.background_ids.search(
-                        lang_domain
-                        + [
-                            ("type", "=", "expression"),
-                            ("report_id", "=", report.id),
-                        ],
-                        limit=1,
+                if header:
+                    head_file_fd, head_file_path = new_temporary_file(
+                        suffix=".html", prefix="report.header.tmp."
                     )
-                    # search append attachment record. #T6622
-                    append_attachment = report.background_ids.search(
-                        lang_domain
-                        + [
-                            ("type", "=", "append"),
-                            ("report_id", "=", report.id),
-                        ],
+                    with closing(os.fdopen(head_file_fd, "wb")) as head_file:
+                        head_file.write(header.encode())
+                    files_command_args.extend(["--header-html", head_file_path])
+                if footer:
+                    foot_file_fd, foot_file_path = new_temporary_file(
+                        suffix=".html", prefix="report.footer.tmp."
                     )
-                    # search prepend attachment record. #T6622
-                    prepend_attachment = report.background_ids.search(
-                        lang_domain
-                        + [
-                            ("type", "=", "prepend"),
-                            ("report_id", "=", report.id),
-                        ],
+                    with closing(os.fdopen(foot_file_fd, "wb")) as foot_file:
+                        foot_file.write(footer.encode())
+                    files_command_args.extend(["--footer-html", foot_file_path])
+
+                paths = []
+                for i, body in enumerate(bodies):
+                    prefix = "%s%d." % ("report.body.tmp.", i)
+                    body_file_fd, body_file_path = new_temporary_file(
+                        suffix=".html", prefix=prefix
                     )
+                    with closing(os.fdopen(body_file_fd, "wb")) as body_file:
+                        body_file.write(body.encode())
+                    paths.append(body_file_path)
 
-                company_background = self._context.get("background_company")
-                company_background_img = (
-                    company_background.custom_report_background_image
-                )
-                # Start. #22260
-                if report.is_bg_per_lang:
-                    lang_code = report.get_lang()
-                    custom_bg_lang = company_background.bg_per_lang_ids.filtered(
-                        lambda lang: lang.lang_id.code == lang_code
+                # Large prints may be split in chunks of bodies rendered by several
+                # wkhtmltopdf processes at once.
+                chunk_size = report.wkhtmltopdf_chunk_size if report else 0
+                if report and (report.attachment or report.custom_bg_per_record):
+                    # The outlines of wkhtmltopdf are lost when the chunks are
+                    # stitched, while they are needed to split the document per
+                    # record.
+                    chunk_size = 0
+                parallelism = report.wkhtmltopdf_parallelism if report else 0
+                if chunk_size > 0 and parallelism > 1 and len(paths) > chunk_size:
+                    chunks = [
+                        paths[index : index + chunk_size]
+                        for index in range(0, len(paths), chunk_size)
+                    ]
+                else:
+                    chunks = [paths]
+
+                wkhtmltopdf_commands = []
+                pdf_report_paths = []
+                for chunk in chunks:
+                    pdf_report_fd, pdf_report_path = new_temporary_file(
+                        suffix=".pdf", prefix="report.tmp."
                     )
-                # End. #22260
-                for i in range(pdf_reader_content.getNumPages()):
-                    watermark = ""
-                    # Bizzappdev customization start. #T6622
-                    if report.custom_report_type == "dynamic_per_report_company_lang":
-                        watermark_attachment = report.per_report_com_lang_bg_ids.search(
-                            lang_domain
-                            + [
-                                ("type_attachment", "=", "background"),
-                                ("report_id", "=", report.id),
-                            ],
-                            limit=1,
-                        )
-                        watermark = watermark_attachment.background_pdf
-                    elif first_page and i == 0:
-                        if first_page.fall_back_to_company and company_background:
-                            # Start. #22260
-                            # If is_bg_per_lang then get custom bg from the company.
-                            if report.is_bg_per_lang:
-                                watermark = custom_bg_lang[:1].background_pdf
-                            else:
-                                watermark = company_background_img
-                            # End. #22260
-                        # Fix page 1st issue. #22260
-                        elif first_page.background_pdf:
-                            watermark = first_page.background_pdf
-                    elif last_page and i == pdf_reader_content.getNumPages() - 1:
-                        if last_page.fall_back_to_company and company_background:
-                            # Start. #22260
-                            # If is_bg_per_lang then get custom bg from the company.
-                            if report.is_bg_per_lang:
-                                watermark = custom_bg_lang[:1].background_pdf
-                            else:
-                                watermark = company_background_img
-                            # End. #22260
-                        elif last_page.background_pdf:
-                            watermark = last_page.background_pdf
-                    elif i + 1 in fixed_pages.mapped("page_number"):
-                        fixed_page = fixed_pages.search(
-                            [
-                                ("page_number", "=", i + 1),
-                                ("report_id", "=", report.id),
-                            ],
-                            limit=1,
-                        )
-                        if (
-                            fixed_page
-                            and fixed_page.fall_back_to_company
-                            and company_background
-                        ):
-                            # Start. #22260
-                            # If is_bg_per_lang then get custom bg from the company.
-                            if report.is_bg_per_lang:
-                                watermark = custom_bg_lang[:1].background_pdf
-                            else:
-                                watermark = company_background_img
-                            # End. #22260
-                        elif fixed_page and fixed_page.background_pdf:
-                            watermark = fixed_page.background_pdf
-                    elif expression and expression.page_expression:
-                        eval_dict = {"page": i + 1}
-                        safe_eval(
-                            expression.page_expression,
-                            eval_dict,
-                            mode="exec",
-                            nocopy=True,
-                        )
-                        if (
-                            expression.fall_back_to_company
-                            and company_background
-                            and eval_dict.get("result", False)
-                        ):
-                            # Start. #22260
-                            # If is_bg_per_lang then get custom bg from the company.
-                            if report.is_bg_per_lang:
-                                watermark = custom_bg_lang[:1].background_pdf
-                            else:
-                                watermark = company_background_img
-                            # End. #22260
-                        elif (
-                            eval_dict.get("result", False) and expression.background_pdf
-                        ):
-                            watermark = expression.background_pdf
+                    os.close(pdf_report_fd)
+                    pdf_report_paths.append(pdf_report_path)
+                    wkhtmltopdf_commands.append(
+                        [_get_wkhtmltopdf_bin()]
+                        + command_args
+                        + files_command_args
+                        + chunk
+                        + [pdf_report_path]
+                    )
+                try:
+                    with render_stats.stage("wkhtmltopdf"):
+                        if len(wkhtmltopdf_commands) == 1:
+                            _call_wkhtmltopdf(wkhtmltopdf_commands[0])
                         else:
-                            if remaining_pages:
-                                if (
-                                    remaining_pages.fall_back_to_company
-                                    and company_background
-                                ):
-                                    # Start. #22260
-                                    # If is_bg_per_lang then get
-                                    # custom bg from the company.
-                                    if report.is_bg_per_lang:
-                                        watermark = custom_bg_lang[:1].background_pdf
-                                    else:
-                                        watermark = company_background_img
-                                    # End. #22260
-                                elif remaining_pages.background_pdf:
-                                    watermark = remaining_pages.background_pdf
-                    else:
-                        if remaining_pages:
-                            if (
-                                remaining_pages.fall_back_to_company
-                                and company_background
-                            ):
-                                # Start. #22260
-                                # If is_bg_per_lang then get custom bg from the company.
-                                if report.is_bg_per_lang:
-                                    watermark = custom_bg_lang[:1].background_pdf
-                                else:
-                                    watermark = company_background_img
-                                # End. #22260
-                            elif remaining_pages.background_pdf:
-                                watermark = remaining_pages.background_pdf
-                    if watermark:
-                        page = report.add_pdf_watermarks(
-                            watermark,
-                            pdf_reader_content.getPage(i),
-                        )
-                    else:
-                        page = pdf_reader_content.getPage(i)
-                    output.addPage(page)
-                output.write(open(temp_report_path, "wb"))
-                pdf_report_path = temp_report_path
-                os.close(temp_report_id)
-            elif report.custom_report_background:
-                temp_back_id, temp_back_path = tempfile.mkstemp(
-                    suffix=".pdf", prefix="back_report.tmp."
+                            max_processes = self._get_wkhtmltopdf_max_processes()
+                            with ThreadPoolExecutor(
+                                max_workers=min(parallelism, len(wkhtmltopdf_commands))
+                            ) as executor:
+                                list(
+                                    executor.map(
+                                        lambda command: _call_wkhtmltopdf(
+                                            command, max_processes=max_processes
+                                        ),
+                                        wkhtmltopdf_commands,
+                                    )
+                                )
+                except Exception as ex:
+                    logging.info("Error while PDF Background %s" % ex)
+                    raise
+                render_stats.count(
+                    "wkhtmltopdf_bytes",
+                    sum(os.path.getsize(path) for path in pdf_report_paths),
                 )
-                custom_background = False
-                # From Report Type.
-                if (
-                    report
-                    and report.custom_report_background
-                    and report.custom_report_type == "report"
-                ):
-                    # 222760 Starts.If background per lang is True then call method for
-                    # get custom background based on different languages.
-                    if report.is_bg_per_lang:
-                        custom_background = report.with_context(
-                            **self.env.context
-                        ).get_bg_per_lang()
-                    # 222760 Ends.
+
+                # The intermediate documents are kept in memory or in temporary
+                # files, depending on the overlay mode.
+                in_memory = self._is_overlay_in_memory()
+                with ExitStack() as stack:
+
+                    def new_pdf_stream(prefix):
+                        if in_memory:
+                            return io.BytesIO()
+                        pdf_fd, pdf_path = new_temporary_file(
+                            suffix=".pdf", prefix=prefix
+                        )
+                        return stack.enter_context(os.fdopen(pdf_fd, "w+b"))
+
+                    if len(pdf_report_paths) == 1:
+                        pdf_stream = stack.enter_context(
+                            open(pdf_report_paths[0], "rb")
+                        )
+                        if in_memory:
+                            pdf_stream = io.BytesIO(pdf_stream.read())
                     else:
-                        custom_background = report.custom_report_background_image
-                    # 222760 Ends.
-                # From Company Type.
-                if (
-                    report.custom_report_background
-                    and not custom_background
-                    and (
-                        report.custom_report_type == "company"
-                        or not report.custom_report_type
-                    )
-                    and self._context.get("background_company")  # #19896
-                ):
-                    # report background will be displayed based on the current
-                    # company #19896
-                    company_id = self._context.get("background_company")
-                    # 222760 Starts. If background per lang is True then call method for
-                    # get custom background from company based on different languages.
-                    if report.is_bg_per_lang:
-                        custom_background = report.with_context(
+                        # Stitch the chunks in order before applying the background.
+                        pdf_stream = new_pdf_stream("report.tmp.")
+                        engine = self._get_pdf_engine()
+                        with render_stats.stage("stitch"):
+                            output = engine.new_output()
+                            for chunk_path in pdf_report_paths:
+                                engine.add_document(
+                                    output,
+                                    engine.open(
+                                        stack.enter_context(open(chunk_path, "rb"))
+                                    ),
+                                )
+                            engine.save(output, pdf_stream)
+
+                    # The background is applied by the caller when it is resolved per
+                    # record.
+                    if (
+                        report
+                        and report.custom_report_background
+                        and not self._context.get("custom_bg_skip_overlay")
+                    ):
+                        # The content is read from the wkhtmltopdf output and the
+                        # result written to another stream, the whole document is only
+                        # loaded once when it is returned.
+                        pdf_stream.seek(0)
+                        output_stream = new_pdf_stream("with_back_report.tmp.")
+                        if report.with_context(
                             **self.env.context
-                        ).get_bg_per_lang()
-                    # 222760 Ends.
-                    else:
-                        custom_background = company_id.custom_report_background_image
-                # If background found from any type then set that to the report.
-                if custom_background:
-                    back_data = base64.b64decode(custom_background)
-                    with closing(os.fdopen(temp_back_id, "wb")) as back_file:
-                        back_file.write(back_data)
-                    temp_report_id, temp_report_path = tempfile.mkstemp(
-                        suffix=".pdf", prefix="with_back_report.tmp."
-                    )
-                    output = PdfFileWriter()
-                    pdf_reader_content = PdfFileReader(pdf_report_path, "rb")
-
-                    for i in range(pdf_reader_content.getNumPages()):
-                        page = pdf_reader_content.getPage(i)
-                        pdf_reader_watermark = PdfFileReader(temp_back_path, "rb")
-                        watermark = pdf_reader_watermark.getPage(0)
-                        watermark.mergePage(page)
-                        output.addPage(watermark)
-                    output.write(open(temp_report_path, "wb"))
-                    pdf_report_path = temp_report_path
-                    os.close(temp_report_id)
-        except Exception as ex:
-            logging.info("Error while PDF Background %s" % ex)
-            raise
+                        )._apply_custom_background(pdf_stream, output_stream):
+                            pdf_stream = output_stream
 
-        with open(pdf_report_path, "rb") as pdf_document:
-            pdf_content = pdf_document.read()
+                    pdf_stream.seek(0)
+                    pdf_content = pdf_stream.read()
+            finally:
+                if render_directory:
+                    shutil.rmtree(render_directory, ignore_errors=True)
+                # Manual cleanup of the temporary files
+                for temporary_file in temporary_files:
+                    try:
+                        os.unlink(temporary_file)
+                    except OSError:  # pylint: disable=B014
+                        _logger.error(
+                            "Error when trying to remove file %s" % temporary_file
+                        )
 
-        # BAD Customization start. T6622
-        if (
-            report
-            and report.custom_report_background
-            and report.custom_report_type
-            in ["dynamic", "dynamic_per_report_company_lang"]
-        ):
-            if report.custom_report_type == "dynamic_per_report_company_lang":
-                # search append attachment record. #T6622
-                append_attachment = report.per_report_com_lang_bg_ids.search(
-                    lang_domain
-                    + [
-                        ("type_attachment", "=", "append"),
-                        ("report_id", "=", report.id),
-                    ],
+            if render_key:
+                render_cache.put(
+                    self._get_render_cache_directory(),
+                    render_key,
+                    pdf_content,
+                    render_cache_size,
                 )
-                # search prepend attachment record. #T6622
-                prepend_attachment = report.per_report_com_lang_bg_ids.search(
-                    lang_domain
-                    + [
-                        ("type_attachment", "=", "prepend"),
-                        ("report_id", "=", report.id),
-                    ],
-                )
-
-            if append_attachment or prepend_attachment:
-                data = []
-                # Merge multiple prepend attachment. #T6622
-                for prepend_data in prepend_attachment:
-                    if prepend_data and prepend_data.background_pdf:
-                        data.append(base64.b64decode(prepend_data.background_pdf))
-                data.append(pdf_content)
-                # Merge multiple append attachment. #T6622
-                for append_data in append_attachment:
-                    if append_data and append_data.background_pdf:
-                        data.append(base64.b64decode(append_data.background_pdf))
-                # call function for merge pdf reports and attachments. #T6622
-                pdf_content = pdf.merge_pdf(data)
-
-        # Manual cleanup of the temporary files
-        for temporary_file in temporary_files:
-            try:
-                os.unlink(temporary_file)
-            except OSError:  # pylint: disable=B014
-                _logger.error("Error when trying to remove file %s" % temporary_file)
 
-        return pdf_content
+            render_stats.count("output_bytes", len(pdf_content))
+            if start_rss is not None:
+                render_stats.count("peak_rss_kb", _get_peak_rss())
+                render_stats.count("rss_growth_kb", _get_peak_rss() - start_rss)
+            elif resource:
+                # Only the peak of the whole life of the process is known, it only
+                # grows when the render uses more memory than any render before.
+                render_stats.count("process_peak_rss_kb", _get_peak_rss())
+                render_stats.count(
+                    "process_peak_rss_growth_kb", _get_peak_rss() - peak_rss
+                )
+            return pdf_content
@@ -0,0 +1,254 @@
+# See LICENSE file for full copyright and licensing details.
+import io
+import json
+import logging
+import traceback
+from datetime import timedelta
+
+from odoo import _, api, fields, models
+
+_logger = logging.getLogger(__name__)
+
+# Number of records rendered between two progress updates.
+JOB_BATCH_SIZE = 50
+
+# Number of days the finished jobs and their documents are kept.
+JOB_RETENTION_DAYS = 7
+
+# Number of minutes without progress after which a running job is considered
+# interrupted, its worker being killed by a time or memory limit.
+JOB_TIMEOUT_MINUTES = 60
+
+# Number of times a job is started before it is failed.
+JOB_MAX_ATTEMPTS = 3
+
+
+class ReportBackgroundJob(models.Model):
+    _name = "report.background.job"
+    _description = "Report Background Print Job"
+    _order = "id desc"
+
+    name = fields.Char(required=True)
+    report_id = fields.Many2one(
+        "ir.actions.report", string="Report", required=True, ondelete="cascade"
+    )
+    res_ids = fields.Text(string="Record IDs", required=True)
+    data = fields.Text()
+    user_id = fields.Many2one(
+        "res.users", string="User", required=True, default=lambda self: self.env.user
+    )
+    company_id = fields.Many2one(
+        "res.company", string="Company", default=lambda self: self.env.company
+    )
+    allowed_company_ids = fields.Char()
+    lang = fields.Char()
+    state = fields.Selection(
+        [
+            ("queued", "Queued"),
+            ("running", "Running"),
+            ("done", "Done"),
+            ("failed", "Failed"),
+        ],
+        default="queued",
+        required=True,
+        index=True,
+    )
+    progress = fields.Integer(help="Percentage of the records rendered.")
+    attempts = fields.Integer(readonly=True, help="Number of times the job started.")
+    attachment_id = fields.Many2one("ir.attachment", string="Document", readonly=True)
+    error = fields.Text(readonly=True)
+    date_done = fields.Datetime(readonly=True)
+
+    @api.model
+    def _enqueue(self, report, res_ids, data=None):
+        """Queue the print of ``res_ids`` with ``report`` for the current user."""
+        job = self.sudo().create(
+            {
+                "name": report.name,
+                "report_id": report.id,
+                "res_ids": json.dumps(list(res_ids)),
+                "data": json.dumps(data) if data else False,
+                "user_id": self.env.uid,
+                "company_id": self.env.company.id,
+                "allowed_company_ids": json.dumps(self.env.companies.ids),
+                "lang": self.env.lang,
+            }
+        )
+        # Start the queue as soon as possible instead of waiting for the next
+        # scheduled run.
+        self.env.ref(
+            "custom_background.ir_cron_process_report_background_jobs"
+        ).sudo()._trigger()
+        return self.browse(job.id)
+
+    @api.model
+    def _process_queue(self, limit=10):
+        """Render the queued jobs, called by the scheduled action. Jobs are locked
+        so that several cron workers never render the same job."""
+        self._requeue_interrupted_jobs()
+        for _i in range(limit):
+            self.env.cr.execute(
+                """
+                SELECT id FROM report_background_job
+                WHERE state = 'queued'
+                ORDER BY id
+                LIMIT 1
+                FOR UPDATE SKIP LOCKED
+                """
+            )
+            row = self.env.cr.fetchone()
+            if not row:
+                return
+            job = self.browse(row[0])
+            job.write({"state": "running", "progress": 0, "attempts": job.attempts + 1})
+            self.env.cr.commit()  # pylint: disable=invalid-commit
+            job._run()
+
+    @api.model
+    def _requeue_interrupted_jobs(self):
+        """Queue again the running jobs without progress for a while, their worker
+        was killed by a time or memory limit. Jobs started too many times are
+        failed."""
+        self.env.cr.execute(
+            """
+            SELECT id FROM report_background_job
+            WHERE state = 'running' AND write_date < %s
+            FOR UPDATE SKIP LOCKED
+            """,
+            [fields.Datetime.now() - timedelta(minutes=JOB_TIMEOUT_MINUTES)],
+        )
+        jobs = self.browse([row[0] for row in self.env.cr.fetchall()])
+        if not jobs:
+            return
+        failed_jobs = jobs.filtered(lambda job: job.attempts >= JOB_MAX_ATTEMPTS)
+        (jobs - failed_jobs).write({"state": "queued", "progress": 0})
+        for job in failed_jobs:
+            _logger.warning("Background print job %s was interrupted", job.id)
+            job.write(
+                {
+                    "state": "failed",
+                    "error": _(
+                        "The print was interrupted %s times, the documents are too "
+                        "large to be printed at once."
+                    )
+                    % job.attempts,
+                    "date_done": fields.Datetime.now(),
+                }
+            )
+            job._notify_user(
+                _("The document %s could not be generated.") % job.name,
+                warning=True,
+            )
+        self.env.cr.commit()  # pylint: disable=invalid-commit
+
+    def _run(self):
+        self.ensure_one()
+        try:
+            pdf_content = self._render()
+        except Exception as e:
+            self.env.cr.rollback()
+            _logger.exception("Background print job %s failed", self.id)
+            self.write(
+                {
+                    "state": "failed",
+                    "error": "%s\n\n%s" % (e, traceback.format_exc()),
+                    "date_done": fields.Datetime.now(),
+                }
+            )
+            self._notify_user(
+                _("The document %s could not be generated.") % self.name,
+                warning=True,
+            )
+            self.env.cr.commit()  # pylint: disable=invalid-commit
+            return
+        attachment = (
+            self.env["ir.attachment"]
+            .sudo()
+            .create(
+                {
+                    "name": "%s.pdf" % self.name,
+                    "raw": pdf_content,
+                    "mimetype": "application/pdf",
+                    "res_model": self._name,
+                    "res_id": self.id,
+                }
+            )
+        )
+        self.write(
+            {
+                "state": "done",
+                "progress": 100,
+                "attachment_id": attachment.id,
+                "date_done": fields.Datetime.now(),
+            }
+        )
+        self._notify_user(_("The document %s is ready.") % self.name)
+        self.env.cr.commit()  # pylint: disable=invalid-commit
+
+    def _render(self):
+        """Render the records of the job by batches as its user, committing the
+        progress after every batch, and return the PDF of all the batches."""
+        self.ensure_one()
+        res_ids = json.loads(self.res_ids)
+        data = json.loads(self.data) if self.data else None
+        report = (
+            self.report_id.with_user(self.user_id)
+            .with_company(self.company_id)
+            .with_context(
+                lang=self.lang,
+                allowed_company_ids=json.loads(self.allowed_company_ids or "[]")
+                or self.company_id.ids,
+                custom_bg_job=True,
+            )
+        )
+        documents = []
+        for index in range(0, len(res_ids), JOB_BATCH_SIZE):
+            batch_ids = res_ids[index : index + JOB_BATCH_SIZE]
+            documents.append(
+                report._render_qweb_pdf(report.id, res_ids=batch_ids, data=data)[0]
+            )
+            self.progress = min(
+                99, (index + len(batch_ids)) * 100 // max(len(res_ids), 1)
+            )
+            self.env.cr.commit()  # pylint: disable=invalid-commit
+        if len(documents) == 1:
+            return documents[0]
+        engine = report._get_pdf_engine()
+        output = engine.new_output()
+        for document in documents:
+            engine.add_document(output, engine.open(io.BytesIO(document)))
+        output_stream = io.BytesIO()
+        engine.save(output, output_stream)
+        return output_stream.getvalue()
+
+    def _notify_user(self, message, warning=False):
+        """Notify the user of the job in the web client, with a button
+        downloading the document of the job or opening the job."""
+        self.ensure_one()
+        self.env["bus.bus"]._sendone(
+            self.user_id.partner_id,
+            "custom_background.background_print",
+            {
+                "title": _("Background Print"),
+                "message": message,
+                "type": "warning" if warning else "success",
+                "job_id": self.id,
+                "attachment_id": self.attachment_id.id,
+            },
+        )
+
+    @api.autovacuum
+    def _gc_finished_jobs(self):
+        """Remove the finished jobs and their documents after a few days."""
+        jobs = self.sudo().search(
+            [
+                ("state", "in", ("done", "failed")),
+                (
+                    "date_done",
+                    "<",
+                    fields.Datetime.now() - timedelta(days=JOB_RETENTION_DAYS),
+                ),
+            ]
+        )
+        jobs.attachment_id.unlink()
+        jobs.unlink()
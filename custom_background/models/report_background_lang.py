@@ -1,9 +1,12 @@
 # See LICENSE file for full copyright and licensing details.
-from odoo import fields, models
+from odoo import api, fields, models
+
+from ..tools.background_cache import background_cache
 
 
 class ReportBackgroundLang(models.Model):
     _name = "report.background.lang"
+    _inherit = ["report.background.mixin"]
     _description = "Report Background Line Per Language"
 
     # New fields. #22260
@@ -19,3 +22,19 @@ class ReportBackgroundLang(models.Model):
         "res.company",
         string="Company",
     )
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        # Compiled background plans use the company backgrounds per language.
+        self.clear_caches()
+        return super().create(vals_list)
+
+    def write(self, vals):
+        background_cache.clear()
+        self.clear_caches()
+        return super().write(vals)
+
+    def unlink(self):
+        background_cache.clear()
+        self.clear_caches()
+        return super().unlink()
@@ -0,0 +1,90 @@
+# See LICENSE file for full copyright and licensing details.
+import base64
+import logging
+
+from odoo import _, api, models
+from odoo.exceptions import UserError
+
+_logger = logging.getLogger(__name__)
+
+
+class ReportBackgroundMixin(models.AbstractModel):
+    """Normalize the background PDF of a model when it is written.
+
+    Only the first page of a background is ever drawn, so the uploaded PDF is
+    replaced by its first page alone with compressed streams.
+    """
+
+    _name = "report.background.mixin"
+    _description = "Report Background Normalization"
+
+    # Binary field holding the background PDF.
+    _background_field = "background_pdf"
+
+    def _is_background_page(self, vals):
+        """Return whether the PDF written with ``vals`` is drawn as a background
+        page, and not added as a whole document."""
+        return True
+
+    def _normalize_background_vals(self, vals):
+        field = self._background_field
+        if not vals.get(field):
+            return vals
+        try:
+            data = (
+                self.env["ir.actions.report"]
+                ._get_pdf_engine()
+                .normalize_background(base64.b64decode(vals[field]))
+            )
+        except Exception as e:
+            _logger.info("Invalid background PDF: %s", e)
+            raise UserError(
+                _("The background must be a valid PDF file with at least one page.")
+            ) from e
+        return dict(vals, **{field: base64.b64encode(data)})
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        vals_list = [
+            self._normalize_background_vals(vals)
+            if self._background_field in vals and self._is_background_page(vals)
+            else vals
+            for vals in vals_list
+        ]
+        return super().create(vals_list)
+
+    def _get_background_checksums(self):
+        """Return the checksums of the attachments holding the backgrounds."""
+        return set(
+            self.env["ir.attachment"]
+            .sudo()
+            .search(
+                [
+                    ("res_model", "=", self._name),
+                    ("res_field", "=", self._background_field),
+                    ("res_id", "in", self.ids),
+                ]
+            )
+            .mapped("checksum")
+        )
+
+    def write(self, vals):
+        if self._background_field not in vals:
+            return super().write(vals)
+        checksums = self._get_background_checksums()
+        pages = self.filtered(lambda record: record._is_background_page(vals))
+        if pages:
+            super(ReportBackgroundMixin, pages).write(
+                self._normalize_background_vals(vals)
+            )
+        if self - pages:
+            super(ReportBackgroundMixin, self - pages).write(vals)
+        # Remove the replaced backgrounds from the store shared by the workers.
+        self.env["ir.actions.report"]._clean_background_store(checksums)
+        return True
+
+    def unlink(self):
+        checksums = self._get_background_checksums()
+        res = super().unlink()
+        self.env["ir.actions.report"]._clean_background_store(checksums)
+        return res
@@ -1,9 +1,13 @@
 # See LICENSE file for full copyright and licensing details.
-from odoo import fields, models
+from odoo import api, fields, models
+from odoo.tools.sql import create_index
+
+from ..tools.background_cache import background_cache
 
 
 class ReportCompanyBackgroundLang(models.Model):
     _name = "report.company.background.lang"
+    _inherit = ["report.background.mixin"]
     _description = "Report Company Background Line Per Language"
 
     # New fields. #T5886
@@ -24,3 +28,35 @@ class ReportCompanyBackgroundLang(models.Model):
         string="Type",
         default="background",
     )
+
+    def _is_background_page(self, vals):
+        # Append and prepend attachments are added with all their pages.
+        return vals.get("type_attachment", self.type_attachment) not in (
+            "append",
+            "prepend",
+        )
+
+    def init(self):
+        # Backgrounds are looked up by report, company, language and type.
+        create_index(
+            self._cr,
+            "report_company_background_lang_lookup_index",
+            self._table,
+            ["report_id", "company_id", "lang_id", "type_attachment"],
+        )
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        # The background maps of the reports depend on the lines.
+        self.clear_caches()
+        return super().create(vals_list)
+
+    def write(self, vals):
+        background_cache.clear()
+        self.clear_caches()
+        return super().write(vals)
+
+    def unlink(self):
+        background_cache.clear()
+        self.clear_caches()
+        return super().unlink()
@@ -2,9 +2,13 @@
 from odoo import _, api, fields, models
 from odoo.exceptions import UserError
 
+from ..tools.background_cache import background_cache
+
 
 class ResCompany(models.Model):
-    _inherit = "res.company"
+    _name = "res.company"
+    _inherit = ["res.company", "report.background.mixin"]
+    _background_field = "custom_report_background_image"
 
     custom_report_background_image = fields.Binary(string="Custom Report Background")
     # New field. #22260
@@ -17,35 +21,40 @@ class ResCompany(models.Model):
         string="Background Per Language",
     )
 
+    def write(self, vals):
+        # Drop the parsed backgrounds when the company background changes.
+        if {
+            "custom_report_background_image",
+            "is_bg_per_lang",
+            "bg_per_lang_ids",
+        } & set(vals):
+            background_cache.clear()
+            self.clear_caches()
+        return super().write(vals)
+
     @api.constrains("is_bg_per_lang", "bg_per_lang_ids")
     def _check_company_custom_bg_config(self):
         """New constrains method for check custom bg per company is set or not when
-        'From Company' type is set at ir_actions_report level. #22260"""
-        # Env.
-        report_env = self.env["ir.actions.report"]
-        # Search report based on the 'company' type and 'is_bg_per_lang' boolean.
-        report_ids = report_env.search(
-            [
-                ("custom_report_type", "in", ["company", False]),
-                ("is_bg_per_lang", "=", True),
-            ]
+        'From Company' type is set at ir_actions_report level. #22260
+
+        The companies are checked together, with at most two queries on the
+        reports whatever the number of companies."""
+        # Companies with background per language configured are fine.
+        companies = self.filtered(
+            lambda company: not (company.is_bg_per_lang and company.bg_per_lang_ids)
         )
-        # Search dynamic reoprt.
-        dynamic_report_ids = report_env.search(
+        if not companies:
+            return
+        report_env = self.env["ir.actions.report"]
+        # If a dynamic report falls back to company and custom bg per lang is not
+        # set then raise warning.
+        if report_env.search(
             [
                 ("custom_report_type", "=", "dynamic"),
                 ("is_bg_per_lang", "=", True),
-            ]
-        )
-        is_fall_back_to_company = False
-        if dynamic_report_ids:
-            # Get report in which Fall back to company is true.
-            is_fall_back_to_company = dynamic_report_ids.mapped(
-                "background_ids"
-            ).filtered(lambda r: r.fall_back_to_company)
-        # If fall_back_to_company and custom bg per lang is not set then raise warning.
-        if is_fall_back_to_company and not (
-            self.is_bg_per_lang and self.bg_per_lang_ids
+                ("background_ids.fall_back_to_company", "=", True),
+            ],
+            limit=1,
         ):
             raise UserError(
                 _(
@@ -55,7 +64,13 @@ class ResCompany(models.Model):
             )
         # If any report with company type and custom bg per lang is not set at
         # res_company level then raise warning.
-        if report_ids and not (self.is_bg_per_lang and self.bg_per_lang_ids):
+        if report_env.search(
+            [
+                ("custom_report_type", "in", ["company", False]),
+                ("is_bg_per_lang", "=", True),
+            ],
+            limit=1,
+        ):
             raise UserError(
                 _(
                     "Please configure Custom Background Per Language beacuse "
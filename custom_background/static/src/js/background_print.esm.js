@@ -0,0 +1,91 @@
+/** @odoo-module **/
+/* See LICENSE file for full copyright and licensing details. */
+
+import {registry} from "@web/core/registry";
+
+/**
+ * Queue the prints of the reports printed in background instead of downloading
+ * them, the server returns the notification to display.
+ */
+async function backgroundPrintHandler(action, options, env) {
+    const activeIds = (action.context && action.context.active_ids) || [];
+    if (
+        !action.id ||
+        action.report_type !== "qweb-pdf" ||
+        !action.custom_report_background ||
+        !action.custom_bg_async ||
+        !activeIds.length
+    ) {
+        return false;
+    }
+    const result = await env.services.orm.call(
+        "ir.actions.report",
+        "report_action",
+        [[action.id], activeIds],
+        {data: action.data || null, config: false}
+    );
+    if (result.type === "ir.actions.report") {
+        return false;
+    }
+    await env.services.action.doAction(result);
+    return true;
+}
+
+registry
+    .category("ir.actions.report handlers")
+    .add("custom_background_print", backgroundPrintHandler);
+
+/**
+ * Notify the user when a background print is done, with a button downloading the
+ * document or opening the failed print.
+ */
+export const backgroundPrintService = {
+    dependencies: ["action", "bus_service", "notification"],
+    start(env, {action, bus_service, notification}) {
+        bus_service.addEventListener("notification", ({detail: notifications}) => {
+            for (const {type, payload} of notifications) {
+                if (type !== "custom_background.background_print") {
+                    continue;
+                }
+                const button = payload.attachment_id
+                    ? {
+                          name: env._t("Download"),
+                          primary: true,
+                          onClick: () =>
+                              action.doAction({
+                                  type: "ir.actions.act_url",
+                                  url: `/web/content/${payload.attachment_id}?download=true`,
+                                  target: "self",
+                              }),
+                      }
+                    : {
+                          name: env._t("Open"),
+                          onClick: () =>
+                              action.doAction({
+                                  type: "ir.actions.act_window",
+                                  res_model: "report.background.job",
+                                  res_id: payload.job_id,
+                                  views: [[false, "form"]],
+                              }),
+                      };
+                const close = notification.add(payload.message, {
+                    title: payload.title,
+                    type: payload.type,
+                    sticky: true,
+                    buttons: [
+                        {
+                            ...button,
+                            onClick: () => {
+                                button.onClick();
+                                close();
+                            },
+                        },
+                    ],
+                });
+            }
+        });
+        bus_service.start();
+    },
+};
+
+registry.category("services").add("custom_background_print", backgroundPrintService);
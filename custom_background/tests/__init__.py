@@ -0,0 +1,7 @@
+# See LICENSE file for full copyright and licensing details.
+from . import test_background_plan
+from . import test_company_lang_background
+from . import test_background_job
+from . import test_benchmark
+from . import test_pdf_engine
+from . import test_stored_background
@@ -0,0 +1,81 @@
+# See LICENSE file for full copyright and licensing details.
+from datetime import timedelta
+from unittest.mock import patch
+
+from odoo import fields
+from odoo.tests.common import TransactionCase
+
+from ..models.report_background_job import JOB_MAX_ATTEMPTS, JOB_TIMEOUT_MINUTES
+
+
+class TestBackgroundJob(TransactionCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.report = cls.env["ir.actions.report"].create(
+            {
+                "name": "Background job",
+                "model": "res.partner",
+                "report_type": "qweb-pdf",
+                "report_name": "custom_background.background_job",
+                "custom_report_background": True,
+                "custom_bg_async": True,
+            }
+        )
+        cls.partners = cls.env["res.partner"].create(
+            [{"name": "Partner %d" % index} for index in range(3)]
+        )
+
+    def test_report_action_enqueue(self):
+        action = self.report.report_action(self.partners, config=False)
+        self.assertEqual(action["type"], "ir.actions.client")
+        self.assertEqual(action["tag"], "display_notification")
+        job = self.env["report.background.job"].search(
+            [("report_id", "=", self.report.id)]
+        )
+        self.assertEqual(job.state, "queued")
+        self.assertEqual(job.user_id, self.env.user)
+
+        self.report.custom_bg_async = False
+        action = self.report.report_action(self.partners, config=False)
+        self.assertEqual(action["type"], "ir.actions.report")
+
+    def test_report_action_not_pdf(self):
+        self.report.report_type = "qweb-html"
+        action = self.report.report_action(self.partners, config=False)
+        self.assertEqual(action["type"], "ir.actions.report")
+        self.assertFalse(
+            self.env["report.background.job"].search(
+                [("report_id", "=", self.report.id)]
+            )
+        )
+
+    def test_requeue_interrupted_jobs(self):
+        jobs = self.env["report.background.job"].create(
+            [
+                {
+                    "name": self.report.name,
+                    "report_id": self.report.id,
+                    "res_ids": "[%d]" % self.partners[0].id,
+                    "state": "running",
+                    "attempts": attempts,
+                }
+                for attempts in (1, JOB_MAX_ATTEMPTS, 1)
+            ]
+        )
+        interrupted_job, failed_job, running_job = jobs
+        jobs.flush_recordset()
+        self.env.cr.execute(
+            "UPDATE report_background_job SET write_date = %s WHERE id IN %s",
+            [
+                fields.Datetime.now() - timedelta(minutes=JOB_TIMEOUT_MINUTES + 1),
+                (interrupted_job.id, failed_job.id),
+            ],
+        )
+        jobs.invalidate_recordset()
+        with patch.object(self.env.cr, "commit"):
+            self.env["report.background.job"]._requeue_interrupted_jobs()
+        self.assertEqual(interrupted_job.state, "queued")
+        self.assertEqual(failed_job.state, "failed")
+        self.assertTrue(failed_job.error)
+        self.assertEqual(running_job.state, "running")
@@ -0,0 +1,254 @@
+# See LICENSE file for full copyright and licensing details.
+import base64
+import hashlib
+
+from odoo.tests.common import TransactionCase
+from odoo.tools.safe_eval import safe_eval
+
+from .test_benchmark import make_pdf
+
+
+def _checksum(background):
+    return (
+        hashlib.sha1(base64.b64decode(background)).hexdigest() if background else False
+    )
+
+
+class TestBackgroundPlan(TransactionCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.backgrounds = [
+            base64.b64encode(make_pdf(1, "Background %d" % index)) for index in range(6)
+        ]
+        cls.lang_en = cls.env.ref("base.lang_en")
+        cls.lang_fr = cls.env.ref("base.lang_fr")
+        cls.company = cls.env.company
+        cls.company.custom_report_background_image = cls.backgrounds[5]
+        cls.report = cls.env["ir.actions.report"].create(
+            {
+                "name": "Background plan",
+                "model": "res.partner",
+                "report_type": "qweb-pdf",
+                "report_name": "custom_background.background_plan",
+                "custom_report_background": True,
+                "custom_report_type": "dynamic",
+            }
+        )
+
+    def _set_lines(self, lines, **vals):
+        self.report.write(
+            dict(
+                vals,
+                background_ids=[(5, 0, 0)]
+                + [
+                    (
+                        0,
+                        0,
+                        dict(
+                            line_vals,
+                            background_pdf=self.backgrounds[
+                                line_vals["background_pdf"]
+                            ],
+                        ),
+                    )
+                    if "background_pdf" in line_vals
+                    else (0, 0, line_vals)
+                    for line_vals in lines
+                ],
+            )
+        )
+
+    def _get_plan_checksums(self, lang_code, page_count):
+        plan = self.report.with_context(
+            custom_bg_lang=lang_code, background_company=self.company
+        )._get_background_plan()
+        return [
+            source.checksum if source else False
+            for source in plan.get_page_sources(page_count)
+        ]
+
+    def _get_search_checksums(self, lang_code, page_count):
+        """Return the checksums of the backgrounds of every page given by the
+        search based rules the background plans replaced."""
+        report = self.report
+        company = self.company
+        if report.is_bg_per_lang:
+            lang_domain = [("lang_id.code", "=", lang_code)]
+            company_background = company.bg_per_lang_ids.filtered(
+                lambda lang: lang.lang_id.code == lang_code
+            )[:1].background_pdf
+        else:
+            lang_domain = [("lang_id", "=", False)]
+            company_background = company.custom_report_background_image
+        lines = self.env["report.background.line"]
+
+        def search(line_type, limit=1):
+            return lines.search(
+                lang_domain + [("type", "=", line_type), ("report_id", "=", report.id)],
+                limit=limit,
+            )
+
+        def line_background(line):
+            if line.fall_back_to_company and company:
+                return company_background
+            return line.background_pdf
+
+        first_page = search("first_page")
+        last_page = search("last_page")
+        fixed_pages = search("fixed", limit=None)
+        expression = search("expression")
+        remaining = search("remaining")
+        backgrounds = []
+        for i in range(page_count):
+            if first_page and i == 0:
+                background = line_background(first_page)
+            elif last_page and i == page_count - 1:
+                background = line_background(last_page)
+            elif i + 1 in fixed_pages.mapped("page_number"):
+                background = line_background(
+                    fixed_pages.filtered(lambda line: line.page_number == i + 1)[:1]
+                )
+            else:
+                result = False
+                if expression.page_expression:
+                    eval_dict = {"page": i + 1}
+                    safe_eval(
+                        expression.page_expression, eval_dict, mode="exec", nocopy=True
+                    )
+                    result = eval_dict.get("result", False)
+                if result and (
+                    (expression.fall_back_to_company and company)
+                    or expression.background_pdf
+                ):
+                    background = line_background(expression)
+                else:
+                    background = remaining and line_background(remaining)
+            backgrounds.append(_checksum(background))
+        return backgrounds
+
+    def _assert_same_backgrounds(self, lang_code=False):
+        for page_count in range(1, 8):
+            with self.subTest(lang_code=lang_code, page_count=page_count):
+                self.assertEqual(
+                    self._get_plan_checksums(lang_code, page_count),
+                    self._get_search_checksums(lang_code, page_count),
+                )
+
+    def test_page_rules(self):
+        configurations = [
+            [
+                {"type": "first_page", "background_pdf": 0},
+                {"type": "last_page", "fall_back_to_company": True},
+                {"type": "fixed", "page_number": 3, "background_pdf": 1},
+                {"type": "fixed", "page_number": 4, "fall_back_to_company": True},
+                {
+                    "type": "expression",
+                    "page_expression": "result = page % 2 == 0",
+                    "background_pdf": 2,
+                },
+                {"type": "remaining", "background_pdf": 3},
+            ],
+            [
+                # An expression without background falls back to the remaining
+                # pages.
+                {"type": "expression", "page_expression": "result = page > 1"},
+                {"type": "remaining", "background_pdf": 3},
+                {"type": "last_page", "background_pdf": 1},
+            ],
+            [
+                # A first page without background leaves the first page as it is.
+                {"type": "first_page"},
+                {
+                    "type": "expression",
+                    "page_expression": "result = page > 2",
+                    "fall_back_to_company": True,
+                },
+                {"type": "remaining", "fall_back_to_company": True},
+            ],
+            [
+                {"type": "fixed", "page_number": 2, "background_pdf": 0},
+                {"type": "fixed", "page_number": 2, "background_pdf": 1},
+            ],
+            [{"type": "remaining", "background_pdf": 4}],
+        ]
+        for lines in configurations:
+            self._set_lines(lines)
+            self._assert_same_backgrounds()
+
+    def test_page_rules_per_lang(self):
+        self.env["res.company"].search([]).write(
+            {
+                "is_bg_per_lang": True,
+                "bg_per_lang_ids": [
+                    (
+                        0,
+                        0,
+                        {
+                            "lang_id": self.lang_en.id,
+                            "background_pdf": self.backgrounds[4],
+                        },
+                    ),
+                    (
+                        0,
+                        0,
+                        {
+                            "lang_id": self.lang_fr.id,
+                            "background_pdf": self.backgrounds[5],
+                        },
+                    ),
+                ],
+            }
+        )
+        self._set_lines(
+            [
+                {"type": "first_page", "lang_id": self.lang_en.id, "background_pdf": 0},
+                {
+                    "type": "remaining",
+                    "lang_id": self.lang_en.id,
+                    "fall_back_to_company": True,
+                },
+                {
+                    "type": "first_page",
+                    "lang_id": self.lang_fr.id,
+                    "fall_back_to_company": True,
+                },
+                {
+                    "type": "fixed",
+                    "lang_id": self.lang_fr.id,
+                    "page_number": 2,
+                    "background_pdf": 2,
+                },
+                {"type": "remaining", "lang_id": self.lang_fr.id, "background_pdf": 1},
+            ],
+            is_bg_per_lang=True,
+        )
+        self._assert_same_backgrounds("en_US")
+        self._assert_same_backgrounds("fr_FR")
+
+    def test_plan_invalidation(self):
+        self._set_lines([{"type": "remaining", "background_pdf": 0}])
+        line = self.report.background_ids
+        self.assertEqual(
+            self._get_plan_checksums(False, 1), [_checksum(line.background_pdf)]
+        )
+        line.background_pdf = self.backgrounds[1]
+        self.assertEqual(
+            self._get_plan_checksums(False, 1), [_checksum(line.background_pdf)]
+        )
+        line.write({"type": "first_page"})
+        self.assertEqual(
+            self._get_plan_checksums(False, 2), [_checksum(line.background_pdf), False]
+        )
+        line.fall_back_to_company = True
+        self.assertEqual(
+            self._get_plan_checksums(False, 1),
+            [_checksum(self.company.custom_report_background_image)],
+        )
+        self.company.custom_report_background_image = self.backgrounds[2]
+        self.assertEqual(
+            self._get_plan_checksums(False, 1),
+            [_checksum(self.company.custom_report_background_image)],
+        )
+        line.unlink()
+        self.assertEqual(self._get_plan_checksums(False, 1), [False])
@@ -0,0 +1,254 @@
+# See LICENSE file for full copyright and licensing details.
+"""Benchmark of the background overlay of ``_run_wkhtmltopdf``.
+
+Every background configuration is rendered for synthetic content documents of
+several sizes, wkhtmltopdf being replaced by a pre-made PDF. The run reports the
+pages rendered per second, the peak Python memory and the number of SQL queries of
+every configuration. The benchmark is not part of the standard tests, it is run
+with ``--test-tags benchmark``.
+
+The results are compared with the baseline stored in the file set by the
+'custom_background.benchmark_baseline' system parameter, the test fails when a
+configuration is slower, uses more memory or more queries than the baseline by
+more than 20%. The baseline is specific to the machine, the first run records it
+when the file does not exist.
+"""
+import base64
+import io
+import json
+import logging
+import os
+import time
+import tracemalloc
+from unittest.mock import patch
+
+from PyPDF2 import PdfFileReader
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfgen import canvas
+
+from odoo.tests.common import TransactionCase, tagged
+
+from ..models import report as report_module
+from ..tools.background_cache import background_cache
+from ..tools.pdf_engine import BACKGROUND_XOBJECT_PREFIX
+
+_logger = logging.getLogger(__name__)
+
+PAGE_COUNTS = (1, 10, 100, 1000)
+
+CONFIGURATIONS = (
+    "company",
+    "report",
+    "dynamic",
+    "dynamic_append_prepend",
+    "dynamic_per_report_company_lang",
+    "dynamic_per_report_company_lang_append_prepend",
+)
+
+# Relative difference with the baseline reported as a regression.
+REGRESSION_THRESHOLD = 0.2
+
+
+def make_pdf(page_count, text, lines=0, pagesize=A4):
+    """Return a PDF of ``page_count`` pages of ``pagesize`` showing ``text``, with
+    ``lines`` vector lines per page to weigh the backgrounds."""
+    data = io.BytesIO()
+    pdf = canvas.Canvas(data, pagesize=pagesize)
+    for page in range(page_count):
+        pdf.drawString(100, 750, "%s %d" % (text, page + 1))
+        for line in range(lines):
+            pdf.line(line % 500, line % 800, (line * 7) % 500, (line * 3) % 800)
+        pdf.showPage()
+    pdf.save()
+    return data.getvalue()
+
+
+def _setup_configuration(env, configuration):
+    """Create a report of the partners using the background ``configuration``."""
+    backgrounds = [
+        base64.b64encode(make_pdf(1, "Background %d" % index, lines=200))
+        for index in range(3)
+    ]
+    attachment = base64.b64encode(make_pdf(2, "Attachment"))
+    company = env.company
+    lang = env["res.lang"]._lang_get(env.user.lang)
+    report_type = configuration.replace("_append_prepend", "")
+    report = env["ir.actions.report"].create(
+        {
+            "name": "Background benchmark %s" % configuration,
+            "model": "res.partner",
+            "report_type": "qweb-pdf",
+            "report_name": "custom_background.benchmark_%s" % configuration,
+            "custom_report_background": True,
+            "custom_report_type": report_type,
+            "custom_report_background_image": backgrounds[0],
+        }
+    )
+    if report_type == "company":
+        company.custom_report_background_image = backgrounds[0]
+    elif report_type == "dynamic":
+        lines = [
+            {"type": "first_page", "background_pdf": backgrounds[0]},
+            {
+                "type": "expression",
+                "page_expression": "result = page % 2 == 0",
+                "background_pdf": backgrounds[1],
+            },
+            {"type": "remaining", "background_pdf": backgrounds[2]},
+        ]
+        if configuration.endswith("_append_prepend"):
+            lines += [
+                {"type": "append", "background_pdf": attachment},
+                {"type": "prepend", "background_pdf": attachment},
+            ]
+        report.background_ids = [(0, 0, vals) for vals in lines]
+    elif report_type == "dynamic_per_report_company_lang":
+        lines = [
+            {
+                "type_attachment": "background",
+                "company_id": company.id,
+                "lang_id": lang.id,
+                "background_pdf": backgrounds[0],
+            }
+        ]
+        if configuration.endswith("_append_prepend"):
+            lines += [
+                {
+                    "type_attachment": type_attachment,
+                    "company_id": company.id,
+                    "lang_id": lang.id,
+                    "background_pdf": attachment,
+                }
+                for type_attachment in ("append", "prepend")
+            ]
+        report.per_report_com_lang_bg_ids = [(0, 0, vals) for vals in lines]
+    return report
+
+
+def _render(env, report, content):
+    """Run ``_run_wkhtmltopdf`` on ``report``, wkhtmltopdf writing ``content``."""
+
+    def call_wkhtmltopdf(command, max_processes=0):
+        with open(command[-1], "wb") as pdf_report:
+            pdf_report.write(content)
+
+    partner = env.user.partner_id
+    with patch.object(
+        report_module, "_call_wkhtmltopdf", call_wkhtmltopdf
+    ), patch.object(report_module, "_get_wkhtmltopdf_bin", lambda: "wkhtmltopdf"):
+        return (
+            env["ir.actions.report"]
+            .with_context(
+                custom_bg_res_ids=partner.ids,
+                custom_bg_lang=env.user.lang,
+                background_company=env.company,
+            )
+            ._run_wkhtmltopdf(["<html/>"], report_ref=report.id)
+        )
+
+
+def _has_background(data):
+    """Return whether a page of the PDF ``data`` is drawn on a background."""
+    for page in PdfFileReader(io.BytesIO(data)).pages:
+        xobjects = page["/Resources"].get("/XObject", {})
+        if any(name.startswith(BACKGROUND_XOBJECT_PREFIX) for name in xobjects):
+            return True
+    return False
+
+
+def _measure(env, report, content, page_count, repeat):
+    # The first render fills the caches, the fastest of the next ones is kept.
+    _render(env, report, content)
+    durations = []
+    for _i in range(repeat):
+        env.invalidate_all()
+        query_count = env.cr.sql_log_count
+        start = time.perf_counter()
+        _render(env, report, content)
+        durations.append(time.perf_counter() - start)
+        query_count = env.cr.sql_log_count - query_count
+    # Memory is traced in a separate render, tracing slows the render down.
+    tracemalloc.start()
+    try:
+        _render(env, report, content)
+        peak_memory = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {
+        "pages_per_second": round(page_count / min(durations), 2),
+        "peak_memory_kb": peak_memory // 1024,
+        "queries": query_count,
+    }
+
+
+def compare_with_baseline(results, baseline, threshold):
+    """Return the regressions of ``results`` against ``baseline``, as messages."""
+    regressions = []
+    for key, result in results.items():
+        reference = baseline.get(key)
+        if not reference:
+            continue
+        if result["pages_per_second"] < reference["pages_per_second"] * (1 - threshold):
+            regressions.append(
+                "%s: %.2f pages/s instead of %.2f"
+                % (key, result["pages_per_second"], reference["pages_per_second"])
+            )
+        for measure in ("peak_memory_kb", "queries"):
+            if result[measure] > reference[measure] * (1 + threshold):
+                regressions.append(
+                    "%s: %s %s instead of %s"
+                    % (key, result[measure], measure, reference[measure])
+                )
+    return regressions
+
+
+@tagged("-standard", "benchmark")
+class TestBackgroundBenchmark(TransactionCase):
+    def test_benchmark(self):
+        """Benchmark the overlay of every background configuration for documents
+        of every page count and compare the results with the baseline."""
+        env = self.env
+        contents = {count: make_pdf(count, "Content page") for count in PAGE_COUNTS}
+        # The render cache would skip the overlay.
+        env["ir.config_parameter"].set_param("custom_background.render_cache_size", 0)
+        self.addCleanup(background_cache.clear)
+        results = {}
+        for configuration in CONFIGURATIONS:
+            report = _setup_configuration(env, configuration)
+            env.flush_all()
+            background_cache.clear()
+            # A configuration matching no background would time the plain copy.
+            self.assertTrue(
+                _has_background(_render(env, report, contents[1])), configuration
+            )
+            for page_count in PAGE_COUNTS:
+                key = "%s/%d" % (configuration, page_count)
+                results[key] = _measure(
+                    env, report, contents[page_count], page_count, 3
+                )
+                _logger.info(
+                    "%s: %.2f pages/s, peak memory %s KB, %s queries",
+                    key,
+                    results[key]["pages_per_second"],
+                    results[key]["peak_memory_kb"],
+                    results[key]["queries"],
+                )
+
+        baseline_path = (
+            env["ir.config_parameter"]
+            .sudo()
+            .get_param("custom_background.benchmark_baseline")
+        )
+        if not baseline_path:
+            _logger.info("No benchmark baseline set, the results are not compared")
+            return
+        if not os.path.exists(baseline_path):
+            with open(baseline_path, "w") as baseline_file:
+                json.dump(results, baseline_file, indent=4, sort_keys=True)
+            _logger.info("Benchmark baseline written to %s", baseline_path)
+            return
+        with open(baseline_path) as baseline_file:
+            baseline = json.load(baseline_file)
+        regressions = compare_with_baseline(results, baseline, REGRESSION_THRESHOLD)
+        if regressions:
+            self.fail("\n".join(regressions))
@@ -0,0 +1,111 @@
+# See LICENSE file for full copyright and licensing details.
+import base64
+import hashlib
+
+from odoo.tests.common import TransactionCase
+
+from .test_benchmark import make_pdf
+
+
+class TestCompanyLangBackground(TransactionCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.backgrounds = [
+            base64.b64encode(make_pdf(1, "Background %d" % index)) for index in range(5)
+        ]
+        cls.lang_en = cls.env.ref("base.lang_en")
+        cls.lang_fr = cls.env.ref("base.lang_fr")
+        cls.company = cls.env.company
+        cls.other_company = cls.env["res.company"].create({"name": "Other Company"})
+        cls.report = cls.env["ir.actions.report"].create(
+            {
+                "name": "Company language background",
+                "model": "res.partner",
+                "report_type": "qweb-pdf",
+                "report_name": "custom_background.company_lang_background",
+                "custom_report_background": True,
+                "custom_report_type": "dynamic_per_report_company_lang",
+            }
+        )
+        cls.lines = cls.env["report.company.background.lang"].create(
+            [
+                {
+                    "report_id": cls.report.id,
+                    "company_id": company.id,
+                    "lang_id": lang.id,
+                    "background_pdf": cls.backgrounds[index],
+                }
+                for index, (company, lang) in enumerate(
+                    [
+                        (cls.company, cls.lang_en),
+                        (cls.company, cls.env["res.lang"]),
+                        (cls.env["res.company"], cls.lang_en),
+                        (cls.env["res.company"], cls.env["res.lang"]),
+                    ]
+                )
+            ]
+        )
+
+    def _get_checksum(self, company, lang_code):
+        page_sources = self.report.with_context(
+            custom_bg_lang=lang_code, background_company=company
+        )._get_custom_background_sources(1)[0]
+        return page_sources[0].checksum if page_sources[0] else False
+
+    def _get_background_checksum(self, index):
+        return hashlib.sha1(
+            base64.b64decode(self.lines[index].background_pdf)
+        ).hexdigest()
+
+    def test_fallback(self):
+        # Company and language, company only, language only, neither of them.
+        self.assertEqual(
+            self._get_checksum(self.company, "en_US"), self._get_background_checksum(0)
+        )
+        self.assertEqual(
+            self._get_checksum(self.company, "fr_FR"), self._get_background_checksum(1)
+        )
+        self.assertEqual(
+            self._get_checksum(self.other_company, "en_US"),
+            self._get_background_checksum(2),
+        )
+        self.assertEqual(
+            self._get_checksum(self.other_company, "fr_FR"),
+            self._get_background_checksum(3),
+        )
+
+    def test_append_prepend_without_fallback(self):
+        self.env["report.company.background.lang"].create(
+            {
+                "report_id": self.report.id,
+                "company_id": self.company.id,
+                "lang_id": self.lang_en.id,
+                "type_attachment": "append",
+                "background_pdf": base64.b64encode(make_pdf(2, "Append")),
+            }
+        )
+        report = self.report.with_context(custom_bg_lang="en_US")
+        self.assertEqual(
+            len(
+                report.with_context(
+                    background_company=self.company
+                )._get_custom_background_sources(1)[2]
+            ),
+            1,
+        )
+        self.assertFalse(
+            report.with_context(
+                background_company=self.other_company
+            )._get_custom_background_sources(1)[2]
+        )
+
+    def test_invalidation(self):
+        self.lines[0].background_pdf = self.backgrounds[4]
+        self.assertEqual(
+            self._get_checksum(self.company, "en_US"), self._get_background_checksum(0)
+        )
+        self.lines[0].unlink()
+        self.assertEqual(
+            self._get_checksum(self.company, "en_US"), self._get_background_checksum(1)
+        )
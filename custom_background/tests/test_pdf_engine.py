@@ -0,0 +1,86 @@
+# See LICENSE file for full copyright and licensing details.
+import io
+
+from PyPDF2 import PdfFileReader, PdfFileWriter
+from PyPDF2.generic import ArrayObject, DecodedStreamObject, NameObject
+from reportlab.lib.pagesizes import A5
+
+from odoo.tests.common import TransactionCase
+
+from ..tools.pdf_engine import PDF_ENGINES, PikepdfEngine, pypdf
+from .test_benchmark import make_pdf
+
+
+def make_multi_stream_pdf():
+    """Return a one page PDF whose content is split in two content streams."""
+    page = PdfFileReader(io.BytesIO(make_pdf(1, "First stream"))).getPage(0)
+    writer = PdfFileWriter()
+    second_stream = DecodedStreamObject()
+    second_stream.setData(b"BT /F1 12 Tf 100 200 Td (Second stream) Tj ET")
+    page[NameObject("/Contents")] = ArrayObject(
+        [dict.__getitem__(page, "/Contents"), writer._addObject(second_stream)]
+    )
+    writer.addPage(page)
+    output_stream = io.BytesIO()
+    writer.write(output_stream)
+    return output_stream.getvalue()
+
+
+class TestPdfEngine(TransactionCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.engines = [engine() for engine in PDF_ENGINES if engine.is_available()]
+        cls.content = make_pdf(3, "Content")
+        cls.backgrounds = {
+            "single": make_pdf(1, "Background"),
+            "multi": make_multi_stream_pdf(),
+            "a5": make_pdf(1, "Small", pagesize=A5),
+        }
+
+    def _get_pages(self, engine, background, fit):
+        """Return the media box and, when pypdf is installed, the text of every
+        page of the content overlaid on ``background`` by ``engine``."""
+        output = engine.new_output()
+        document = engine.open(io.BytesIO(self.content))
+        for index in range(engine.page_count(document)):
+            engine.add_page(output, document, index, background, fit=fit)
+        output_stream = io.BytesIO()
+        engine.save(output, output_stream)
+        pages = []
+        for page in PdfFileReader(output_stream).pages:
+            pages.append([round(float(value), 2) for value in page.mediaBox])
+        if pypdf:
+            # pypdf extracts the text of the Form XObjects as well.
+            output_stream.seek(0)
+            for page, text_page in zip(pages, pypdf.PdfReader(output_stream).pages):
+                page.append(" ".join(text_page.extract_text().split()))
+        return pages
+
+    def test_same_output(self):
+        for name, data in self.backgrounds.items():
+            for fit in (False, True):
+                results = {
+                    engine.name: self._get_pages(
+                        engine, engine.parse_background(data), fit
+                    )
+                    for engine in self.engines
+                }
+                with self.subTest(background=name, fit=fit):
+                    self.assertEqual(len(results["PyPDF2"]), 3)
+                    for engine_name, pages in results.items():
+                        self.assertEqual(pages, results["PyPDF2"], engine_name)
+                    if pypdf:
+                        self.assertIn("Content 1", results["PyPDF2"][0][-1])
+                        if name == "multi":
+                            self.assertIn("Second stream", results["PyPDF2"][0][-1])
+
+    def test_shared_background_untouched(self):
+        if not PikepdfEngine.is_available():
+            self.skipTest("pikepdf is not installed")
+        engine = PikepdfEngine()
+        background = engine.parse_background(self.backgrounds["single"])
+        object_count = len(background.pdf.objects)
+        for _i in range(3):
+            self._get_pages(engine, background, False)
+        self.assertEqual(len(background.pdf.objects), object_count)
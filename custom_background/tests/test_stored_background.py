@@ -0,0 +1,128 @@
+# See LICENSE file for full copyright and licensing details.
+import base64
+import io
+from unittest.mock import patch
+
+from PyPDF2 import PdfFileReader
+
+from odoo.tests.common import TransactionCase
+
+from ..models import report as report_module
+from ..tools.background_cache import background_cache
+from ..tools.pdf_engine import BACKGROUND_XOBJECT_PREFIX
+from .test_benchmark import make_pdf
+
+
+def _count_backgrounds(data):
+    """Return the number of backgrounds drawn on the first page of the PDF
+    ``data``, a background applied twice being drawn twice."""
+    page = PdfFileReader(io.BytesIO(data)).getPage(0)
+    contents = page.getContents()
+    if isinstance(contents, list):
+        return sum(
+            stream.getObject().getData().count(BACKGROUND_XOBJECT_PREFIX.encode())
+            for stream in contents
+        )
+    return contents.getData().count(BACKGROUND_XOBJECT_PREFIX.encode())
+
+
+class TestStoredBackground(TransactionCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.content = make_pdf(1, "Content")
+        cls.env["ir.config_parameter"].set_param(
+            "custom_background.render_cache_size", 0
+        )
+        cls.env["ir.ui.view"].create(
+            {
+                "name": "Stored background",
+                "type": "qweb",
+                "key": "custom_background.stored_background",
+                "arch": """
+                    <t t-name="custom_background.stored_background">
+                        <t t-call="web.html_container">
+                            <t t-foreach="docs" t-as="o">
+                                <div class="article"><span t-esc="o.name"/></div>
+                            </t>
+                        </t>
+                    </t>
+                """,
+            }
+        )
+        cls.report = cls.env["ir.actions.report"].create(
+            {
+                "name": "Stored background",
+                "model": "res.partner",
+                "report_type": "qweb-pdf",
+                "report_name": "custom_background.stored_background",
+                "attachment": "'Stored background %s.pdf' % object.id",
+                "attachment_use": True,
+                "custom_report_background": True,
+                "custom_report_type": "report",
+                "custom_report_background_image": base64.b64encode(
+                    make_pdf(1, "Background")
+                ),
+                "custom_bg_on_download": True,
+            }
+        )
+        cls.partner = cls.env["res.partner"].create({"name": "Stored background"})
+
+    def setUp(self):
+        super().setUp()
+        self.addCleanup(background_cache.clear)
+
+    def _print(self):
+        """Print the partner, wkhtmltopdf writing the content PDF."""
+
+        def call_wkhtmltopdf(command, max_processes=0):
+            with open(command[-1], "wb") as pdf_report:
+                pdf_report.write(self.content)
+
+        with patch.object(
+            report_module, "_call_wkhtmltopdf", call_wkhtmltopdf
+        ), patch.object(report_module, "_get_wkhtmltopdf_bin", lambda: "wkhtmltopdf"):
+            return (
+                self.env["ir.actions.report"]
+                .with_context(force_report_rendering=True)
+                ._render_qweb_pdf(self.report.id, self.partner.ids)[0]
+            )
+
+    def _get_attachment(self):
+        return self.env["ir.attachment"].search(
+            [
+                ("res_model", "=", "res.partner"),
+                ("res_id", "=", self.partner.id),
+                ("name", "=", "Stored background %s.pdf" % self.partner.id),
+            ]
+        )
+
+    def test_stored_without_background(self):
+        # The document is stored as rendered, the background is only applied on
+        # the printed document.
+        self.assertEqual(_count_backgrounds(self._print()), 1)
+        attachment = self._get_attachment()
+        self.assertEqual(len(attachment), 1)
+        self.assertTrue(attachment.custom_bg_without_background)
+        self.assertEqual(_count_backgrounds(attachment.raw), 0)
+
+        # The stored document gets the background once when it is reused.
+        self.assertEqual(_count_backgrounds(self._print()), 1)
+        self.assertEqual(self._get_attachment(), attachment)
+
+        # It still gets it once the option is unset.
+        self.report.custom_bg_on_download = False
+        self.assertEqual(_count_backgrounds(self._print()), 1)
+
+    def test_stored_with_background(self):
+        self.report.custom_bg_on_download = False
+        self.assertEqual(_count_backgrounds(self._print()), 1)
+        attachment = self._get_attachment()
+        self.assertFalse(attachment.custom_bg_without_background)
+        self.assertEqual(_count_backgrounds(attachment.raw), 1)
+
+        # The stored document already has its background, with the option set or
+        # not.
+        self.assertEqual(_count_backgrounds(self._print()), 1)
+        self.report.custom_bg_on_download = True
+        self.assertEqual(_count_backgrounds(self._print()), 1)
@@ -0,0 +1,10 @@
+# See LICENSE file for full copyright and licensing details.
+from . import background_cache
+from . import background_store
+from . import barcode
+from . import background_plan
+from . import page_expression
+from . import process_slots
+from . import pdf_engine
+from . import render_cache
+from . import render_stats
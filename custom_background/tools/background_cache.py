@@ -0,0 +1,64 @@
+# See LICENSE file for full copyright and licensing details.
+import logging
+import threading
+from collections import OrderedDict
+
+_logger = logging.getLogger(__name__)
+
+# Maximum number of parsed backgrounds kept per process.
+BACKGROUND_CACHE_SIZE = 64
+
+
+class BackgroundCache:
+    """Process level, size bounded LRU cache of parsed background PDFs.
+
+    Entries are keyed by the checksum of the ``ir.attachment`` holding the
+    background, so a changed background never hits a stale entry.
+    """
+
+    def __init__(self, max_size=BACKGROUND_CACHE_SIZE):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key, loader):
+        """Return the entry stored for ``key``, calling ``loader()`` to build
+        it when missing. The least recently used entry is dropped once the
+        cache is full."""
+        with self._lock:
+            if key in self._entries:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return self._entries[key]
+            self.misses += 1
+            value = loader()
+            self._entries[key] = value
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+            return value
+
+    def clear(self):
+        with self._lock:
+            if self._entries:
+                _logger.debug("Clearing %s parsed backgrounds", len(self._entries))
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+background_cache = BackgroundCache()
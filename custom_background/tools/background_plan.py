@@ -0,0 +1,111 @@
+# See LICENSE file for full copyright and licensing details.
+from collections import namedtuple
+
+from .page_expression import evaluate_page_mask
+
+# Background attachment reference, ``attachment_id`` is False for a rule which is
+# configured without any background.
+BackgroundSource = namedtuple("BackgroundSource", ["attachment_id", "checksum"])
+
+NO_BACKGROUND = BackgroundSource(False, False)
+
+
+class BackgroundPlan:
+    """Background configuration of a report compiled for one language and one
+    company.
+
+    A plan only holds attachment references, it is cached in the registry and
+    resolving the background of a page never hits the database. A rule is ``None``
+    when it is not configured, and ``NO_BACKGROUND`` when it is configured but does
+    not give any background, in which case the page is left as it is.
+    """
+
+    __slots__ = (
+        "first_page",
+        "last_page",
+        "fixed_pages",
+        "expression",
+        "expression_source",
+        "remaining",
+        "append",
+        "prepend",
+    )
+
+    def __init__(
+        self,
+        first_page=None,
+        last_page=None,
+        fixed_pages=None,
+        expression=None,
+        expression_source=None,
+        remaining=None,
+        append=(),
+        prepend=(),
+    ):
+        self.first_page = first_page
+        self.last_page = last_page
+        self.fixed_pages = fixed_pages or {}
+        self.expression = expression
+        self.expression_source = expression_source
+        self.remaining = remaining
+        self.append = tuple(append)
+        self.prepend = tuple(prepend)
+
+    def fingerprint(self):
+        """Return a tuple identifying the backgrounds given by the plan."""
+        return (
+            self.first_page,
+            self.last_page,
+            tuple(sorted(self.fixed_pages.items())),
+            self.expression,
+            self.expression_source,
+            self.remaining,
+            self.append,
+            self.prepend,
+        )
+
+    def has_page_backgrounds(self):
+        """Return whether any page of a document may get a background, whatever
+        its number of pages."""
+        return any(
+            source and source.attachment_id
+            for source in (
+                self.first_page,
+                self.last_page,
+                self.expression_source if self.expression else None,
+                self.remaining,
+            )
+            + tuple(self.fixed_pages.values())
+        )
+
+    def _get_expression_mask(self, page_count):
+        if not self.expression or self.expression_source is None:
+            return (False,) * page_count
+        return evaluate_page_mask(self.expression, page_count)
+
+    def get_page_source(self, index, page_count, expression_mask=None):
+        """Return the background source of the page ``index`` (starting at 0) of a
+        document of ``page_count`` pages, None if the page has no background."""
+        if expression_mask is None:
+            expression_mask = self._get_expression_mask(page_count)
+        if self.first_page is not None and index == 0:
+            source = self.first_page
+        elif self.last_page is not None and index == page_count - 1:
+            source = self.last_page
+        elif index + 1 in self.fixed_pages:
+            source = self.fixed_pages[index + 1]
+        elif expression_mask[index]:
+            source = self.expression_source
+        else:
+            source = self.remaining
+        return source if source and source.attachment_id else None
+
+    def get_page_sources(self, page_count):
+        """Return the background source of every page of a document of
+        ``page_count`` pages. The page expression is evaluated for the whole page
+        range at once."""
+        expression_mask = self._get_expression_mask(page_count)
+        return [
+            self.get_page_source(i, page_count, expression_mask)
+            for i in range(page_count)
+        ]
@@ -0,0 +1,130 @@
+# See LICENSE file for full copyright and licensing details.
+import logging
+import os
+import stat
+import tempfile
+import threading
+
+_logger = logging.getLogger(__name__)
+
+
+class BackgroundStore:
+    """Files of the background PDFs shared by every worker of the host.
+
+    Every background is written once in a file named after its checksum in the
+    directory given by the caller, the first worker parsing a background warms the
+    store for all the others. The workers parse the file through a read only
+    memory map, so the pages of a background are read from the database once per
+    host and held once in the page cache instead of once per worker.
+    """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def _get_path(self, directory, checksum):
+        return os.path.join(directory, "%s.pdf" % checksum)
+
+    def _count(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def _is_private(self, directory):
+        """Return whether ``directory`` and its parent are real directories of the
+        current user that no other user can write in, so that nobody else can
+        replace a stored background."""
+        if not hasattr(os, "getuid"):
+            return True
+        for path in (directory, os.path.dirname(directory)):
+            try:
+                path_stat = os.lstat(path)
+            except OSError:
+                return False
+            if (
+                not stat.S_ISDIR(path_stat.st_mode)
+                or path_stat.st_uid != os.getuid()
+                or path_stat.st_mode & (stat.S_IWGRP | stat.S_IWOTH)
+            ):
+                return False
+        return True
+
+    def get(self, directory, checksum):
+        """Return the path of the background stored for ``checksum``, None when it
+        is missing or the store is not private."""
+        path = self._get_path(directory, checksum)
+        hit = os.path.isfile(path) and self._is_private(directory)
+        self._count(hit)
+        return path if hit else None
+
+    def put(self, directory, checksum, data):
+        """Store the background ``data`` for ``checksum`` and return the path of
+        its file, None when it could not be written."""
+        try:
+            os.makedirs(os.path.dirname(directory), mode=0o700, exist_ok=True)
+            os.makedirs(directory, mode=0o700, exist_ok=True)
+            if not self._is_private(directory):
+                _logger.warning(
+                    "The background store %s or its parent is not a directory of "
+                    "the current user that only this user can write in, it is not "
+                    "used",
+                    directory,
+                )
+                return None
+            # Write a temporary file renamed at the end, so that other workers
+            # never map a partial background.
+            store_fd, store_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        except OSError:
+            _logger.warning("Could not create the background store %s", directory)
+            return None
+        path = self._get_path(directory, checksum)
+        try:
+            with os.fdopen(store_fd, "wb") as store_file:
+                store_file.write(data)
+            os.replace(store_path, path)
+        except OSError:
+            _logger.warning("Could not store the background %s", checksum)
+            try:
+                os.unlink(store_path)
+            except OSError:
+                _logger.debug("Could not remove the temporary file %s", store_path)
+            return None
+        return path
+
+    def checksums(self, directory):
+        """Return the checksums of the backgrounds stored in ``directory``."""
+        if not os.path.isdir(directory):
+            return set()
+        return {
+            entry.name[: -len(".pdf")]
+            for entry in os.scandir(directory)
+            if entry.name.endswith(".pdf")
+        }
+
+    def remove(self, directory, checksums):
+        """Remove the backgrounds of ``checksums``. Workers mapping one of them
+        keep their mapping until they release it."""
+        for checksum in checksums:
+            try:
+                os.unlink(self._get_path(directory, checksum))
+            except OSError:
+                # Not stored, or removed by another worker in the meantime.
+                _logger.debug("Could not remove the stored background %s", checksum)
+
+    def stats(self, directory=None):
+        with self._lock:
+            stats = {"hits": self.hits, "misses": self.misses}
+        if directory:
+            stats["backgrounds"] = stats["size"] = 0
+            if os.path.isdir(directory):
+                for entry in os.scandir(directory):
+                    if entry.name.endswith(".pdf"):
+                        stats["backgrounds"] += 1
+                        stats["size"] += entry.stat().st_size
+        return stats
+
+
+background_store = BackgroundStore()
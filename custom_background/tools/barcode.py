@@ -0,0 +1,46 @@
+# See LICENSE file for full copyright and licensing details.
+import logging
+import threading
+import time
+
+_logger = logging.getLogger(__name__)
+
+_warm_up_lock = threading.Lock()
+_warmed_up = False
+
+
+def warm_up_barcodes():
+    """Render a throwaway barcode once per process.
+
+    reportlab builds the cache of its T1 fonts when it renders its first barcode,
+    which is not thread safe and locks threaded servers printing several barcodes
+    at once. The warm-up is done on the first PDF render instead of at import, and
+    may be called by a preload hook of the server.
+
+    :return: True if the warm-up was done by this call.
+    """
+    global _warmed_up
+    if _warmed_up:
+        return False
+    with _warm_up_lock:
+        if _warmed_up:
+            return False
+        start = time.perf_counter()
+        try:
+            from reportlab.graphics.barcode import createBarcodeDrawing
+
+            createBarcodeDrawing(
+                "Code128",
+                value="foo",
+                format="png",
+                width=100,
+                height=100,
+                humanReadable=1,
+            ).asString("png")
+        except Exception as e:
+            _logger.info(e)
+        _warmed_up = True
+        _logger.info(
+            "Barcode warm-up done in %.1f ms", (time.perf_counter() - start) * 1000
+        )
+    return True
@@ -0,0 +1,36 @@
+# See LICENSE file for full copyright and licensing details.
+import functools
+
+from odoo.tools import ustr
+from odoo.tools.safe_eval import _BUILTINS, _SAFE_OPCODES, test_expr, unsafe_eval
+
+
+@functools.lru_cache(maxsize=256)
+def compile_page_expression(expression):
+    """Check the page expression against the opcodes allowed by ``safe_eval`` and
+    return its code object. The result is cached by expression text so an
+    expression is only parsed and checked once per process."""
+    return test_expr(expression, _SAFE_OPCODES, mode="exec")
+
+
+@functools.lru_cache(maxsize=256)
+def evaluate_page_mask(expression, page_count):
+    """Evaluate the page expression for the pages 1 to ``page_count`` and return a
+    tuple of booleans, ``True`` at index ``i`` when the expression sets ``result``
+    for the page ``i + 1``.
+
+    The expression is compiled once and run with the same builtins as
+    ``safe_eval`` for every page, e.g. ``result = page % 2 == 0``.
+    """
+    code = compile_page_expression(expression)
+    mask = []
+    for page in range(1, page_count + 1):
+        eval_dict = {"__builtins__": _BUILTINS, "page": page}
+        try:
+            unsafe_eval(code, eval_dict)
+        except Exception as e:
+            raise ValueError(
+                '%s: "%s" while evaluating\n%r' % (ustr(type(e)), ustr(e), expression)
+            ) from e
+        mask.append(bool(eval_dict.get("result", False)))
+    return tuple(mask)
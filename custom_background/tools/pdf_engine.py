@@ -0,0 +1,615 @@
+# See LICENSE file for full copyright and licensing details.
+"""PDF engines used to apply the backgrounds.
+
+Every engine implements the same operations on its own objects: open a content
+document, parse a background, copy content pages to an output with or without a
+background underneath, append whole documents and write the output. The parsed
+backgrounds returned by ``parse_background`` are shared through the background
+cache, so engines never modify them.
+
+A background is converted once per output into a Form XObject, every page using
+it only draws that XObject under its own content. The background is then stored
+once in the output whatever its number of pages, and the content streams of the
+pages are copied as they are instead of being parsed and merged.
+
+When the background is fitted to the pages, the XObject is drawn through a matrix
+scaling it to the media box of every page. The drawing stream is created once per
+background and page size in the output, so documents mixing page sizes still
+store and parse every background once.
+"""
+import io
+import logging
+import mmap
+
+from PyPDF2 import PdfFileReader, PdfFileWriter, generic as PyPDF2_generic
+from PyPDF2.generic import (
+    ArrayObject,
+    DecodedStreamObject,
+    DictionaryObject,
+    IndirectObject,
+    NameObject,
+    NullObject,
+    RectangleObject,
+    StreamObject,
+)
+
+try:
+    from PyPDF2 import PageObject
+except ImportError:
+    from PyPDF2.pdf import PageObject
+
+try:
+    from PyPDF2.generic import ContentStream
+except ImportError:
+    from PyPDF2.pdf import ContentStream
+
+try:
+    import pikepdf
+except ImportError:
+    pikepdf = None
+
+try:
+    import pypdf
+except ImportError:
+    pypdf = None
+
+_logger = logging.getLogger(__name__)
+
+# Resource name prefix of the background Form XObjects.
+BACKGROUND_XOBJECT_PREFIX = "/CustomBackground"
+
+
+def _as_stream(data):
+    """Return ``data`` as a file object, without copying it when it already is
+    one (a memory map of the background store for instance)."""
+    return data if hasattr(data, "read") else io.BytesIO(data)
+
+
+def _map_file(path):
+    """Return a read only memory map of the file ``path``."""
+    with open(path, "rb") as mapped_file:
+        return mmap.mmap(mapped_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def _get_object(obj):
+    return obj.get_object() if hasattr(obj, "get_object") else obj.getObject()
+
+
+def _resolve_pdf_object(obj, indirect_class, seen=None):
+    """Recursively resolve the indirect objects referenced by ``obj`` so a
+    cached page never has to read its source stream again."""
+    if seen is None:
+        seen = set()
+    if isinstance(obj, indirect_class):
+        key = (obj.idnum, obj.generation)
+        if key in seen:
+            return
+        seen.add(key)
+        obj = _get_object(obj)
+    if isinstance(obj, dict):
+        for key, value in obj.items():
+            # Do not walk back up the page tree.
+            if key != "/Parent":
+                _resolve_pdf_object(value, indirect_class, seen)
+    elif isinstance(obj, list):
+        for value in obj:
+            _resolve_pdf_object(value, indirect_class, seen)
+
+
+def _add_writer_object(writer, obj):
+    # PyPDF2 2.x renamed the method.
+    add_object = getattr(writer, "_add_object", None) or writer._addObject
+    return add_object(obj)
+
+
+def _copy_writer_object(writer, obj, copies):
+    """Return a copy of the PyPDF2 object ``obj`` for ``writer``, every indirect
+    object it references being copied once into the writer. ``copies`` maps the
+    source indirect objects already copied to their reference in the writer.
+
+    The writer rewrites the objects it writes in place, so the objects of a cached
+    background are never handed to it."""
+    if isinstance(obj, IndirectObject):
+        key = (id(obj.pdf), obj.idnum, obj.generation)
+        if key not in copies:
+            # The reference is reserved first, so cycles end on it.
+            reference = _add_writer_object(writer, NullObject())
+            copies[key] = reference
+            writer._objects[reference.idnum - 1] = _copy_writer_object(
+                writer, _get_object(obj), copies
+            )
+        return copies[key]
+    if isinstance(obj, StreamObject):
+        stream = obj.__class__()
+        stream._data = obj._data
+        for key, value in obj.items():
+            stream[key] = _copy_writer_object(writer, value, copies)
+        return stream
+    if isinstance(obj, dict):
+        return DictionaryObject(
+            {
+                key: _copy_writer_object(writer, value, copies)
+                for key, value in obj.items()
+                if key != "/Parent"
+            }
+        )
+    if isinstance(obj, list):
+        return ArrayObject(_copy_writer_object(writer, value, copies) for value in obj)
+    return obj
+
+
+def _new_stream(data):
+    stream = DecodedStreamObject()
+    stream.setData(data)
+    return stream
+
+
+def get_fit_matrix(background_box, page_box):
+    """Return the matrix ``(a, b, c, d, e, f)`` scaling and moving the box
+    ``background_box`` onto ``page_box``, boxes being ``(left, bottom, right,
+    top)``. Return None when the boxes are the same."""
+    background_box = [float(value) for value in background_box]
+    page_box = [float(value) for value in page_box]
+    if all(abs(a - b) < 0.01 for a, b in zip(background_box, page_box)):
+        return None
+    left, bottom, right, top = background_box
+    scale_x = (page_box[2] - page_box[0]) / (right - left)
+    scale_y = (page_box[3] - page_box[1]) / (top - bottom)
+    # Rounded so that the matrix is a stable key of the drawing streams.
+    return (
+        round(scale_x, 6),
+        0,
+        0,
+        round(scale_y, 6),
+        round(page_box[0] - left * scale_x, 4),
+        round(page_box[1] - bottom * scale_y, 4),
+    )
+
+
+def _format_number(value):
+    # PDF numbers have no exponent.
+    return ("%.6f" % value).rstrip("0").rstrip(".")
+
+
+def _get_draw_data(name, matrix=None):
+    """Return the content stream drawing the Form XObject ``name`` through
+    ``matrix``."""
+    if matrix is None:
+        return ("q %s Do Q" % name).encode()
+    return (
+        "q %s cm %s Do Q" % (" ".join(_format_number(v) for v in matrix), name)
+    ).encode()
+
+
+def _add_page_background(page, name, xobject, draw, mediabox, generic=PyPDF2_generic):
+    """Draw the background Form XObject ``xobject`` under the content of ``page``
+    with the content stream ``draw``, ``generic`` is the module of the PDF objects
+    of the page. The media box of the page is left as it is when ``mediabox`` is
+    None."""
+    if "/Resources" not in page:
+        page[generic.NameObject("/Resources")] = generic.DictionaryObject()
+    resources = _get_object(page["/Resources"])
+    if "/XObject" not in resources:
+        resources[generic.NameObject("/XObject")] = generic.DictionaryObject()
+    _get_object(resources["/XObject"])[generic.NameObject(name)] = xobject
+    contents = generic.ArrayObject([draw])
+    if "/Contents" in page:
+        # The page dictionary resolves its values, while the content streams must
+        # stay indirect objects.
+        page_contents = dict.__getitem__(page, "/Contents")
+        if isinstance(_get_object(page_contents), list):
+            contents.extend(_get_object(page_contents))
+        else:
+            contents.append(page_contents)
+    page[generic.NameObject("/Contents")] = contents
+    if mediabox is not None:
+        page[generic.NameObject("/MediaBox")] = mediabox
+
+
+class _PdfOutput:
+    """Output document of the PyPDF2 and pypdf engines, with the Form XObject of
+    every background drawn in it."""
+
+    def __init__(self, document, add_stream):
+        self.document = document
+        # Function adding a content stream to the document, returning its
+        # reference.
+        self.add_stream = add_stream
+        # Resource name and XObject reference of every background, by background.
+        self.xobjects = {}
+        # Drawing content stream of every background, by background and matrix.
+        self.draws = {}
+        # The backgrounds are kept so their ids are not reused while the output
+        # is built.
+        self.backgrounds = []
+
+    def add_xobject(self, background, xobject):
+        name = "%s%d" % (BACKGROUND_XOBJECT_PREFIX, len(self.xobjects))
+        self.backgrounds.append(background)
+        self.xobjects[id(background)] = (name, xobject)
+
+    def get_draw(self, background, matrix=None):
+        """Return the reference of the content stream drawing ``background``
+        through ``matrix``."""
+        key = (id(background), matrix)
+        if key not in self.draws:
+            name = self.xobjects[id(background)][0]
+            self.draws[key] = self.add_stream(_get_draw_data(name, matrix))
+        return self.draws[key]
+
+
+class PdfEngine:
+    """Base class of the PDF engines."""
+
+    name = None
+
+    @classmethod
+    def is_available(cls):
+        return True
+
+    def open(self, stream):
+        """Open the PDF document read from ``stream`` (file object or path)."""
+        raise NotImplementedError()
+
+    def open_file(self, path):
+        """Open the PDF document stored in the file ``path``, mapped in memory."""
+        return self.open(_map_file(path))
+
+    def page_count(self, document):
+        raise NotImplementedError()
+
+    def parse_background(self, data):
+        """Parse the background PDF ``data`` (bytes or file object) and return its
+        first page."""
+        raise NotImplementedError()
+
+    def parse_background_file(self, path):
+        """Parse the background PDF stored in the file ``path``, mapped in memory
+        so that the pages of the file are shared by every process reading it."""
+        return self.parse_background(_map_file(path))
+
+    def normalize_background(self, data):
+        """Return the first page of the background PDF ``data`` as a single page
+        PDF with compressed streams. Raise an exception when ``data`` is not a PDF
+        with at least one page."""
+        raise NotImplementedError()
+
+    def new_output(self):
+        raise NotImplementedError()
+
+    def add_page(self, output, document, index, background=None, fit=False):
+        """Add the page ``index`` of ``document`` to ``output``, on top of
+        ``background`` when it is set. The output page has the size of the
+        background, as the page is drawn on the background, unless ``fit`` is set:
+        the background is then scaled to the size of the page."""
+        raise NotImplementedError()
+
+    def add_document(self, output, document):
+        """Add all the pages of ``document`` to ``output``."""
+        for index in range(self.page_count(document)):
+            self.add_page(output, document, index)
+
+    def save(self, output, stream):
+        """Write the PDF of ``output`` into ``stream``."""
+        raise NotImplementedError()
+
+
+class PyPDF2Engine(PdfEngine):
+    """Engine based on the legacy PyPDF2 API shipped with Odoo, always
+    available."""
+
+    name = "PyPDF2"
+
+    def open(self, stream):
+        return PdfFileReader(stream, strict=False)
+
+    def page_count(self, document):
+        return document.getNumPages()
+
+    def parse_background(self, data):
+        watermark_page = PdfFileReader(_as_stream(data), strict=False).getPage(0)
+        _resolve_pdf_object(watermark_page, IndirectObject)
+        return watermark_page
+
+    def normalize_background(self, data):
+        page = PdfFileReader(io.BytesIO(data), strict=False).getPage(0)
+        page.compressContentStreams()
+        writer = PdfFileWriter()
+        writer.addPage(page)
+        output_stream = io.BytesIO()
+        writer.write(output_stream)
+        return output_stream.getvalue()
+
+    def overlay_page(self, background, page, fit=False):
+        """Return a new page with ``page`` merged on top of ``background``, the
+        background page itself is left untouched. The background is scaled to the
+        size of ``page`` when ``fit`` is set."""
+        matrix = fit and get_fit_matrix(background.mediaBox, page.mediaBox)
+        if not matrix:
+            new_page = PageObject.createBlankPage(
+                None,
+                background.mediaBox.getWidth(),
+                background.mediaBox.getHeight(),
+            )
+            new_page.mergePage(background)
+        else:
+            new_page = PageObject.createBlankPage(
+                None, page.mediaBox.getWidth(), page.mediaBox.getHeight()
+            )
+            new_page.mediaBox = RectangleObject(page.mediaBox)
+            new_page.mergeTransformedPage(background, list(matrix))
+        new_page.mergePage(page)
+        return new_page
+
+    def new_output(self):
+        writer = PdfFileWriter()
+        return _PdfOutput(
+            writer, lambda data: _add_writer_object(writer, _new_stream(data))
+        )
+
+    def _get_background_xobject(self, output, background):
+        """Return the resource name and the reference of the Form XObject of
+        ``background`` in ``output``."""
+        if id(background) not in output.xobjects:
+            contents = background.getContents()
+            if isinstance(contents, list):
+                # Page with several content streams.
+                contents = ContentStream(contents, background.pdf)
+            xobject = _new_stream(contents.getData() if contents is not None else b"")
+            # The encoded stream does not keep the entries of the decoded one.
+            xobject = xobject.flateEncode()
+            xobject.update(
+                {
+                    NameObject("/Type"): NameObject("/XObject"),
+                    NameObject("/Subtype"): NameObject("/Form"),
+                    NameObject("/BBox"): RectangleObject(background.mediaBox),
+                    NameObject("/Resources"): _copy_writer_object(
+                        output.document,
+                        dict.get(background, "/Resources", DictionaryObject()),
+                        {},
+                    ),
+                }
+            )
+            output.add_xobject(background, _add_writer_object(output.document, xobject))
+        return output.xobjects[id(background)]
+
+    def add_page(self, output, document, index, background=None, fit=False):
+        page = document.getPage(index)
+        if background is not None:
+            name, xobject = self._get_background_xobject(output, background)
+            matrix = fit and get_fit_matrix(background.mediaBox, page.mediaBox)
+            _add_page_background(
+                page,
+                name,
+                xobject,
+                output.get_draw(background, matrix or None),
+                None if fit else RectangleObject(background.mediaBox),
+            )
+        output.document.addPage(page)
+
+    def save(self, output, stream):
+        output.document.write(stream)
+
+
+class PypdfEngine(PdfEngine):
+    """Engine based on the maintained ``pypdf`` package (version 3 and later)."""
+
+    name = "pypdf"
+
+    @classmethod
+    def is_available(cls):
+        return bool(pypdf) and int(pypdf.__version__.split(".")[0]) >= 3
+
+    def open(self, stream):
+        return pypdf.PdfReader(stream, strict=False)
+
+    def page_count(self, document):
+        return len(document.pages)
+
+    def parse_background(self, data):
+        watermark_page = pypdf.PdfReader(_as_stream(data), strict=False).pages[0]
+        _resolve_pdf_object(watermark_page, pypdf.generic.IndirectObject)
+        return watermark_page
+
+    def normalize_background(self, data):
+        writer = pypdf.PdfWriter()
+        page = writer.add_page(pypdf.PdfReader(io.BytesIO(data), strict=False).pages[0])
+        page.compress_content_streams()
+        output_stream = io.BytesIO()
+        writer.write(output_stream)
+        return output_stream.getvalue()
+
+    def new_output(self):
+        writer = pypdf.PdfWriter()
+
+        def add_stream(data):
+            stream = pypdf.generic.DecodedStreamObject()
+            stream.set_data(data)
+            return writer._add_object(stream)
+
+        return _PdfOutput(writer, add_stream)
+
+    def _get_background_xobject(self, output, background):
+        """Return the resource name and the reference of the Form XObject of
+        ``background`` in ``output``."""
+        if id(background) not in output.xobjects:
+            generic = pypdf.generic
+            writer = output.document
+            contents = background.get_contents()
+            xobject = generic.DecodedStreamObject()
+            xobject.set_data(contents.get_data() if contents is not None else b"")
+            xobject = xobject.flate_encode()
+            resources = background.get("/Resources")
+            xobject.update(
+                {
+                    generic.NameObject("/Type"): generic.NameObject("/XObject"),
+                    generic.NameObject("/Subtype"): generic.NameObject("/Form"),
+                    generic.NameObject("/BBox"): generic.RectangleObject(
+                        background.mediabox
+                    ),
+                    generic.NameObject("/Resources"): resources.get_object().clone(
+                        writer
+                    )
+                    if resources is not None
+                    else generic.DictionaryObject(),
+                }
+            )
+            output.add_xobject(background, writer._add_object(xobject))
+        return output.xobjects[id(background)]
+
+    def add_page(self, output, document, index, background=None, fit=False):
+        page = output.document.add_page(document.pages[index])
+        if background is not None:
+            generic = pypdf.generic
+            name, xobject = self._get_background_xobject(output, background)
+            matrix = fit and get_fit_matrix(background.mediabox, page.mediabox)
+            _add_page_background(
+                page,
+                name,
+                xobject,
+                output.get_draw(background, matrix or None),
+                None if fit else generic.RectangleObject(background.mediabox),
+                generic,
+            )
+
+    def save(self, output, stream):
+        output.document.write(stream)
+
+
+class _PikepdfOutput:
+    """Output document of the pikepdf engine. The source documents are kept
+    open until the output is written, as pikepdf copies their streams lazily."""
+
+    def __init__(self):
+        self.pdf = pikepdf.Pdf.new()
+        self.sources = []
+        # Form XObject of every background drawn in the output, by background.
+        self.xobjects = {}
+        # Drawing content stream of every fitted background, by background and
+        # matrix.
+        self.draws = {}
+
+
+class _PikepdfBackground:
+    """Background parsed by the pikepdf engine, with the Form XObject of its first
+    page built once when it is parsed, as the background is then shared."""
+
+    def __init__(self, pdf):
+        self.pdf = pdf
+        page = pdf.pages[0]
+        self.box = pikepdf.Rectangle(page.mediabox)
+        self.xobject = page.as_form_xobject()
+
+
+class PikepdfEngine(PdfEngine):
+    """Engine based on ``pikepdf`` (qpdf), the fastest when installed."""
+
+    name = "pikepdf"
+
+    @classmethod
+    def is_available(cls):
+        return bool(pikepdf)
+
+    def open(self, stream):
+        return pikepdf.Pdf.open(stream)
+
+    def page_count(self, document):
+        return len(document.pages)
+
+    def parse_background(self, data):
+        return _PikepdfBackground(pikepdf.Pdf.open(_as_stream(data)))
+
+    def open_file(self, path):
+        # qpdf maps the file itself, it does not read from Python memory maps.
+        return pikepdf.Pdf.open(path, access_mode=pikepdf.AccessMode.mmap)
+
+    def parse_background_file(self, path):
+        return _PikepdfBackground(self.open_file(path))
+
+    def normalize_background(self, data):
+        with pikepdf.Pdf.open(io.BytesIO(data)) as pdf:
+            if not pdf.pages:
+                raise ValueError("The PDF has no page")
+            del pdf.pages[1:]
+            pdf.remove_unreferenced_resources()
+            output_stream = io.BytesIO()
+            pdf.save(
+                output_stream,
+                compress_streams=True,
+                object_stream_mode=pikepdf.ObjectStreamMode.generate,
+            )
+        return output_stream.getvalue()
+
+    def new_output(self):
+        return _PikepdfOutput()
+
+    def add_page(self, output, document, index, background=None, fit=False):
+        page = document.pages[index]
+        output.sources.append(document)
+        if background is None:
+            output.pdf.pages.append(page)
+            return
+        if id(background) not in output.xobjects:
+            output.sources.append(background)
+            output.xobjects[id(background)] = (
+                pikepdf.Name(
+                    "%s%d" % (BACKGROUND_XOBJECT_PREFIX, len(output.xobjects))
+                ),
+                output.pdf.copy_foreign(background.xobject),
+            )
+        name, xobject = output.xobjects[id(background)]
+        output.pdf.pages.append(page)
+        new_page = output.pdf.pages[-1]
+        background_box = background.box
+        name = new_page.add_resource(
+            xobject, pikepdf.Name.XObject, name, replace_existing=True
+        )
+        page_box = pikepdf.Rectangle(new_page.mediabox)
+        matrix = fit and get_fit_matrix(
+            (
+                background_box.llx,
+                background_box.lly,
+                background_box.urx,
+                background_box.ury,
+            ),
+            (page_box.llx, page_box.lly, page_box.urx, page_box.ury),
+        )
+        if fit:
+            # The background is scaled to the page, that keeps its size.
+            key = (id(background), matrix or None)
+            if key not in output.draws:
+                output.draws[key] = pikepdf.Stream(
+                    output.pdf, _get_draw_data(str(name), matrix or None)
+                )
+            new_page.contents_add(output.draws[key], prepend=True)
+            return
+        new_page.mediabox = background_box.as_array()
+        # Draw the background at its own size under the untouched content, as
+        # PyPDF2 mergePage does.
+        new_page.contents_add(
+            new_page.calc_form_xobject_placement(
+                xobject, name, background_box, allow_shrink=False, allow_expand=False
+            ),
+            prepend=True,
+        )
+
+    def save(self, output, stream):
+        output.pdf.save(stream)
+
+
+# Engines by order of preference.
+PDF_ENGINES = [PikepdfEngine, PypdfEngine, PyPDF2Engine]
+
+
+def get_pdf_engine(name=None):
+    """Return the engine ``name``, or the fastest available engine when ``name`` is
+    not set or not available."""
+    engines = [engine for engine in PDF_ENGINES if engine.is_available()]
+    if name and name != "auto":
+        for engine in engines:
+            if engine.name.lower() == name.lower():
+                return engine()
+        _logger.warning(
+            "PDF engine %s is not available, using %s", name, engines[0].name
+        )
+    return engines[0]()
@@ -0,0 +1,75 @@
+# See LICENSE file for full copyright and licensing details.
+import logging
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+_logger = logging.getLogger(__name__)
+
+
+class ProcessSlots:
+    """Host wide limit on the number of processes started concurrently.
+
+    Every slot is a lock file, a process may only run while it holds the lock of
+    one of the ``max_slots`` files. The locks are shared by every Odoo worker of
+    the host and released by the kernel if a worker dies.
+    """
+
+    def __init__(self, name, poll_interval=0.1):
+        # One directory per Unix user, the directory of another user's service
+        # could not be opened.
+        if hasattr(os, "getuid"):
+            name = "%s-%d" % (name, os.getuid())
+        self.directory = os.path.join(tempfile.gettempdir(), name)
+        self.poll_interval = poll_interval
+
+    @contextmanager
+    def acquire(self, max_slots):
+        slot = None
+        if fcntl is not None and max_slots > 0:
+            try:
+                slot = self._lock_slot(max_slots)
+            except OSError as error:
+                _logger.warning(
+                    "Cannot lock a process slot in %s, the number of processes is "
+                    "not limited: %s",
+                    self.directory,
+                    error,
+                )
+        if slot is None:
+            yield None
+            return
+        index, slot_fd = slot
+        try:
+            yield index
+        finally:
+            fcntl.flock(slot_fd, fcntl.LOCK_UN)
+            os.close(slot_fd)
+
+    def _lock_slot(self, max_slots):
+        """Wait for a free slot, return its index and the file descriptor holding
+        its lock."""
+        os.makedirs(self.directory, mode=0o700, exist_ok=True)
+        while True:
+            for index in range(max_slots):
+                slot_path = os.path.join(self.directory, "slot.%d" % index)
+                slot_fd = os.open(slot_path, os.O_RDWR | os.O_CREAT, 0o600)
+                try:
+                    fcntl.flock(slot_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    os.close(slot_fd)
+                    continue
+                except OSError:
+                    os.close(slot_fd)
+                    raise
+                return index, slot_fd
+            time.sleep(self.poll_interval)
+
+
+wkhtmltopdf_slots = ProcessSlots("odoo-custom-background-wkhtmltopdf")
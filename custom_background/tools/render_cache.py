@@ -0,0 +1,122 @@
+# See LICENSE file for full copyright and licensing details.
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+
+_logger = logging.getLogger(__name__)
+
+
+def get_render_key(*parts):
+    """Return the cache key of a render made of ``parts`` (strings, bytes or any
+    value with a stable ``repr``)."""
+    digest = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, str):
+            part = part.encode()
+        elif not isinstance(part, bytes):
+            part = repr(part).encode()
+        # Prefix every part with its length so parts never run into each other.
+        digest.update(b"%d:" % len(part))
+        digest.update(part)
+    return digest.hexdigest()
+
+
+class RenderCache:
+    """Disk cache of rendered PDF documents, bounded in size.
+
+    Every document is stored in a file named after its key in the directory given
+    by the caller, so the cache is shared by every worker of the host. The
+    modification time of a file is its last use, the least recently used files are
+    removed once the directory exceeds its maximum size.
+    """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def _get_path(self, directory, key):
+        return os.path.join(directory, "%s.pdf" % key)
+
+    def get(self, directory, key):
+        """Return the document stored for ``key``, None when it is missing."""
+        path = self._get_path(directory, key)
+        try:
+            with open(path, "rb") as cached_file:
+                data = cached_file.read()
+            os.utime(path)
+        except OSError:
+            # Missing, or removed by another worker in the meantime.
+            data = None
+        with self._lock:
+            if data is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return data
+
+    def put(self, directory, key, data, max_size):
+        """Store the document ``data`` for ``key`` and evict the least recently
+        used documents above ``max_size`` bytes."""
+        if len(data) > max_size:
+            return
+        try:
+            os.makedirs(directory, mode=0o700, exist_ok=True)
+            # Write a temporary file renamed at the end, so that other workers
+            # never read a partial document.
+            cache_fd, cache_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        except OSError:
+            _logger.warning("Could not create the render cache %s", directory)
+            return
+        try:
+            with os.fdopen(cache_fd, "wb") as cache_file:
+                cache_file.write(data)
+            os.replace(cache_path, self._get_path(directory, key))
+        except OSError:
+            _logger.warning("Could not store the rendered document %s", key)
+            try:
+                os.unlink(cache_path)
+            except OSError:
+                _logger.debug("Could not remove the temporary file %s", cache_path)
+            return
+        self._evict(directory, max_size)
+
+    def _evict(self, directory, max_size):
+        entries = []
+        total_size = 0
+        for entry in os.scandir(directory):
+            if not entry.name.endswith(".pdf"):
+                continue
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total_size += stat.st_size
+        entries.sort()
+        for _mtime, size, path in entries:
+            if total_size <= max_size:
+                break
+            try:
+                os.unlink(path)
+            except OSError:
+                # Removed by another worker in the meantime.
+                _logger.debug("Could not remove the rendered document %s", path)
+            total_size -= size
+
+    def stats(self, directory=None):
+        with self._lock:
+            stats = {"hits": self.hits, "misses": self.misses}
+        if directory:
+            stats["documents"] = stats["size"] = 0
+            if os.path.isdir(directory):
+                for entry in os.scandir(directory):
+                    if entry.name.endswith(".pdf"):
+                        stats["documents"] += 1
+                        stats["size"] += entry.stat().st_size
+        return stats
+
+
+render_cache = RenderCache()
@@ -0,0 +1,148 @@
+# See LICENSE file for full copyright and licensing details.
+import logging
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+
+_logger = logging.getLogger(__name__)
+
+# Number of renders kept per process.
+RENDER_STATS_SIZE = 500
+
+# Stages of a render, in order.
+RENDER_STAGES = (
+    "render_cache",
+    "wkhtmltopdf",
+    "stitch",
+    "orm",
+    "decode",
+    "merge",
+    "append_prepend",
+)
+
+
+class RenderTimings:
+    """Timings and counters of one render of a report."""
+
+    __slots__ = ("report_name", "start", "duration", "stages", "counters")
+
+    def __init__(self, report_name):
+        self.report_name = report_name
+        self.start = time.time()
+        self.duration = 0.0
+        self.stages = defaultdict(float)
+        self.counters = defaultdict(int)
+
+    def as_dict(self):
+        return {
+            "report_name": self.report_name,
+            "start": self.start,
+            "duration": self.duration,
+            "stages": dict(self.stages),
+            "counters": dict(self.counters),
+        }
+
+    def __str__(self):
+        stages = ", ".join(
+            "%s %.3f s" % (stage, self.stages[stage])
+            for stage in RENDER_STAGES
+            if stage in self.stages
+        )
+        counters = ", ".join(
+            "%s %s" % (name, value) for name, value in sorted(self.counters.items())
+        )
+        return "Rendered %s in %.3f s (%s) [%s]" % (
+            self.report_name,
+            self.duration,
+            stages,
+            counters,
+        )
+
+
+class RenderStats:
+    """Rolling table of the timings of the last renders of the process.
+
+    A render is started by ``render()`` around the whole print, the stages and the
+    counters are added to the render running in the current thread, if any. Nested
+    renders are part of the outer one, so every print gives one entry and one log
+    line.
+    """
+
+    def __init__(self, max_size=RENDER_STATS_SIZE):
+        self._renders = deque(maxlen=max_size)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def current(self):
+        return getattr(self._local, "render", None)
+
+    @contextmanager
+    def render(self, report_name):
+        if self.current() is not None:
+            yield self.current()
+            return
+        timings = RenderTimings(report_name)
+        self._local.render = timings
+        start = time.perf_counter()
+        try:
+            yield timings
+        finally:
+            timings.duration = time.perf_counter() - start
+            self._local.render = None
+            with self._lock:
+                self._renders.append(timings)
+            _logger.info("%s", timings)
+
+    @contextmanager
+    def stage(self, name):
+        """Add the time spent in the block to the stage ``name`` of the current
+        render."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            timings = self.current()
+            if timings is not None:
+                timings.stages[name] += time.perf_counter() - start
+
+    def count(self, name, value=1):
+        timings = self.current()
+        if timings is not None:
+            timings.counters[name] += value
+
+    def renders(self):
+        """Return the renders of the table, the most recent last."""
+        with self._lock:
+            return [timings.as_dict() for timings in self._renders]
+
+    def summary(self):
+        """Return the average and maximum durations and the average stage timings
+        of every report of the table, the slowest reports first."""
+        reports = {}
+        for timings in self.renders():
+            report = reports.setdefault(
+                timings["report_name"],
+                {
+                    "report_name": timings["report_name"],
+                    "count": 0,
+                    "total": 0.0,
+                    "max": 0.0,
+                    "stages": defaultdict(float),
+                },
+            )
+            report["count"] += 1
+            report["total"] += timings["duration"]
+            report["max"] = max(report["max"], timings["duration"])
+            for stage, duration in timings["stages"].items():
+                report["stages"][stage] += duration
+        for report in reports.values():
+            report["average"] = report["total"] / report["count"]
+            report["stages"] = {
+                stage: duration / report["count"]
+                for stage, duration in report["stages"].items()
+            }
+        return sorted(reports.values(), key=lambda r: r["average"], reverse=True)
+
+
+render_stats = RenderStats()